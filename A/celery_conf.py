@@ -1,6 +1,8 @@
 import os
 from celery import Celery
+from celery.signals import celeryd_init
 from datetime import timedelta
+from kombu import Queue
 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'A.settings')
@@ -11,8 +13,63 @@ celery_app.conf.broker_url = 'amqp://localhost'
 # celery_app.conf.broker_url = 'amqp://rabbitmq'
 celery_app.conf.result_backend = 'rpc://'
 celery_app.conf.task_serializer = 'json'
-celery_app.conf.result_serializer = 'pickle'
-celery_app.conf.accept_content = ['json', 'pickle']
+celery_app.conf.result_serializer = 'json'
+celery_app.conf.accept_content = ['json']
 celery_app.conf.result_expires = timedelta(days=1)
 celery_app.conf.task_always_eager = False
-celery_app.conf.worker_prefetch_multiplier = 0
+# one message per worker process at a time, so priorities decide what runs next
+celery_app.conf.worker_prefetch_multiplier = 1
+
+# otp codes get their own queues so an email backlog never delays sms, run a worker per queue:
+#   celery -A A worker -Q otp_sms -n sms@%h
+#   celery -A A worker -Q otp_email -n email@%h
+#   celery -A A worker -Q celery -n default@%h
+# priorities order tasks within one queue, they only matter if both routes point at one queue.
+# every queue binds the default exchange with its own routing key; without one they all get the
+# default 'celery' key and each message is copied to every queue
+OTP_SMS_QUEUE = 'otp_sms'
+OTP_EMAIL_QUEUE = 'otp_email'
+celery_app.conf.task_default_queue = 'celery'
+celery_app.conf.task_queues = (
+    Queue('celery', routing_key='celery'),
+    Queue(OTP_SMS_QUEUE, routing_key=OTP_SMS_QUEUE, max_priority=10),
+    Queue(OTP_EMAIL_QUEUE, routing_key=OTP_EMAIL_QUEUE, max_priority=10),
+)
+celery_app.conf.task_routes = {
+    'accounts.tasks.send_sms_code_task': {'queue': OTP_SMS_QUEUE},
+    'accounts.tasks.send_mail_code_task': {'queue': OTP_EMAIL_QUEUE},
+}
+
+# concurrency of a worker started for a single queue without -c; sending mostly waits on the
+# provider, so the sms queue gets more processes than there are cores
+QUEUE_CONCURRENCY = {
+    OTP_SMS_QUEUE: 16,
+    OTP_EMAIL_QUEUE: 4,
+}
+
+
+@celeryd_init.connect
+def set_queue_concurrency(sender=None, conf=None, options=None, **kwargs):
+    options = options or {}
+    queues = options.get('queues') or []
+    if isinstance(queues, str):
+        queues = queues.split(',')
+    if options.get('concurrency') or len(queues) != 1 or queues[0] not in QUEUE_CONCURRENCY:
+        return
+    conf.worker_concurrency = QUEUE_CONCURRENCY[queues[0]]
+
+
+celery_app.conf.beat_schedule = {
+    'relay-otp-outbox': {
+        'task': 'accounts.tasks.relay_otp_outbox_task',
+        'schedule': timedelta(seconds=10),
+    },
+    'clear-expired-otp-codes': {
+        'task': 'accounts.tasks.clear_expired_otp_codes_task',
+        'schedule': timedelta(minutes=5),
+    },
+    'clear-expired-revoked-tokens': {
+        'task': 'accounts.tasks.clear_expired_revoked_tokens_task',
+        'schedule': timedelta(hours=1),
+    },
+}
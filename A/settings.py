@@ -32,11 +32,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
+    'accounts.middleware.LegacyAuthBackendMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -47,7 +49,7 @@ ROOT_URLCONF = 'A.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -76,10 +78,41 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# use a shared backend (e.g. redis or memcached) when running more than one web process
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
+# the first hasher hashes new passwords, the rest still verify (and upgrade) older hashes;
+# put TunableArgon2PasswordHasher first once argon2-cffi is installed
+PASSWORD_HASHERS = [
+    'accounts.hashers.TunablePBKDF2PasswordHasher',
+    'accounts.hashers.TunableArgon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+# work factors, calibrate them to a target latency with `manage.py benchmark_hashers`
+PASSWORD_PBKDF2_ITERATIONS = 260000
+PASSWORD_ARGON2_TIME_COST = 2
+PASSWORD_ARGON2_MEMORY_COST = 102400
+PASSWORD_ARGON2_PARALLELISM = 8
+
+# password hashing runs in a process pool per web process so it neither holds the GIL nor blocks
+# the event loop; None means one process per cpu, 0 hashes inline on the request thread. logins
+# beyond PASSWORD_POOL_MAX_PENDING queued hashes are answered with 'busy' instead of queueing
+PASSWORD_POOL_WORKERS = None
+PASSWORD_POOL_MAX_PENDING = 64
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -136,15 +169,143 @@ AUTH_USER_MODEL = 'accounts.User'
 AUTHENTICATION_BACKENDS = [
     'social_core.backends.github.GithubOAuth2',
     'social_core.backends.google.GoogleOAuth2',
-    'django.contrib.auth.backends.ModelBackend',
-    'accounts.authenticate.UsernameAuthBackend',
-    'accounts.authenticate.PhoneNumberAuthBackend',
+    'accounts.authenticate.IdentifierAuthBackend',
 ]
 
 # REST FRAMEWORK
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
+        'accounts.authentication.StatelessJWTAuthentication',
     ]
 }
+
+# access tokens carry the user claims, so api requests authenticate without loading the user;
+# a refresh reloads the user, so a deactivated user keeps access until ACCESS_TOKEN_LIFETIME runs out
+SIMPLE_JWT = {
+    'TOKEN_OBTAIN_SERIALIZER': 'accounts.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_USER_CLASS': 'accounts.authentication.ClaimsTokenUser',
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.authentication.RevocationCheckedTokenRefreshSerializer',
+}
+JWT_VERIFIED_CACHE_SIZE = 10000
+
+# refresh tokens revoked by logout or a password change; each process keeps a bloom filter
+# of them that is topped up from the RevokedToken table every JWT_REVOCATION_SYNC_SECONDS;
+# each top-up reads back JWT_REVOCATION_SYNC_OVERLAP_SECONDS to catch rows that committed late
+JWT_REVOCATION_CAPACITY = 100000
+JWT_REVOCATION_ERROR_RATE = 0.001
+JWT_REVOCATION_SYNC_SECONDS = 10
+JWT_REVOCATION_SYNC_OVERLAP_SECONDS = 60
+
+# OTP
+# set OTP_STORE to 'accounts.otp.CacheOtpStore' to keep codes in the OTP_CACHE_ALIAS cache instead of
+# the OtpCode table; that cache has to be shared by every process (redis or memcached, not locmem).
+# a code is burnt after OTP_MAX_ATTEMPTS wrong guesses
+OTP_STORE = 'accounts.otp.ModelOtpStore'
+OTP_CACHE_ALIAS = 'default'
+OTP_EXPIRE_SECONDS = 120
+OTP_MAX_ATTEMPTS = 5
+OTP_SWEEP_BATCH_SIZE = 1000
+
+# OTP OUTBOX
+# with OTP_DELIVERY_MODE = 'outbox' views only write the code to the OtpOutbox table and
+# `manage.py relay_otp_outbox` publishes it to celery, polling every OTP_OUTBOX_POLL_SECONDS when
+# idle; 'direct' publishes from the view. run a single relay, the beat relay task only drains what it
+# leaves behind. relays claim rows in the database, so the two never publish the same row, and a claim
+# left OTP_OUTBOX_CLAIM_SECONDS by a relay that died before publishing or a worker that died while
+# sending is taken over. a failed send is published again after OTP_OUTBOX_RETRY_SECONDS, doubled on
+# every attempt, up to OTP_OUTBOX_MAX_ATTEMPTS sends; a send that may have reached the provider is not
+OTP_DELIVERY_MODE = 'outbox'
+OTP_OUTBOX_BATCH_SIZE = 100
+OTP_OUTBOX_POLL_SECONDS = 0.2
+OTP_OUTBOX_CLAIM_SECONDS = 60
+OTP_OUTBOX_MAX_ATTEMPTS = 3
+OTP_OUTBOX_RETRY_SECONDS = 5
+
+# SMS
+# SMS_DELIVERY_MODE is 'direct' (one provider request per code) or 'batch' (codes are
+# collected for SMS_BATCH_WAIT_MS or up to SMS_BATCH_SIZE and sent with one request)
+SMS_PROVIDER = 'accounts.sms.KavenegarSmsProvider'
+SMS_DELIVERY_MODE = 'direct'
+SMS_BATCH_SIZE = 100
+SMS_BATCH_WAIT_MS = 20
+SMS_STUB_LATENCY_MS = 50
+SMS_HTTP_POOL_SIZE = 10
+SMS_HTTP_CONNECT_TIMEOUT = 3
+SMS_HTTP_READ_TIMEOUT = 10
+SMS_HTTP_RETRIES = 2
+SMS_HTTP_BACKOFF = 0.5
+
+# MAIL
+# with MAIL_DELIVERY_MODE = 'batch' otp emails are queued per worker process and sent in
+# batches over one long-lived smtp connection instead of one connection per email
+MAIL_DELIVERY_MODE = 'direct'
+MAIL_BATCH_SIZE = 50
+MAIL_BATCH_WAIT_MS = 50
+
+# USER CACHE
+# users loaded by the auth backends are kept in a per-process LRU for USER_CACHE_LOCAL_TTL
+# seconds in front of the shared cache; saving or deleting a user drops both entries
+USER_CACHE_ALIAS = 'default'
+USER_CACHE_TIMEOUT = 300
+USER_CACHE_LOCAL_SIZE = 1024
+USER_CACHE_LOCAL_TTL = 5
+
+# LOGIN THROTTLE
+# failed username/password logins are counted per identifier and per client ip over a
+# sliding window; crossing a limit locks that identifier or ip for LOGIN_THROTTLE_LOCK_SECONDS
+LOGIN_THROTTLE_CACHE_ALIAS = 'default'
+LOGIN_THROTTLE_WINDOW = 300
+LOGIN_THROTTLE_USER_LIMIT = 5
+LOGIN_THROTTLE_IP_LIMIT = 50
+LOGIN_THROTTLE_LOCK_SECONDS = 900
+
+# OTP RATE LIMIT
+# token buckets for issuing otp codes: each destination may burst OTP_DESTINATION_BURST codes
+# and earns a new one every OTP_DESTINATION_REFILL_SECONDS, likewise for each client ip
+OTP_RATE_LIMIT_CACHE_ALIAS = 'default'
+OTP_DESTINATION_BURST = 3
+OTP_DESTINATION_REFILL_SECONDS = 120
+OTP_IP_BURST = 20
+OTP_IP_REFILL_SECONDS = 15
+
+# CLIENT IP
+# addresses or networks of the reverse proxies in front of the app; for requests they forward,
+# the client ip is read from X-Forwarded-For instead of REMOTE_ADDR, which would be the proxy's
+TRUSTED_PROXIES = []
+
+# API TOKEN CACHE
+# token key -> user id, kept like the user cache; deleting or regenerating a token drops it
+TOKEN_CACHE_TIMEOUT = 300
+TOKEN_CACHE_LOCAL_SIZE = 4096
+TOKEN_CACHE_LOCAL_TTL = 5
+
+# USER EXPORT
+# rows fetched per database round-trip while streaming an export
+USER_EXPORT_CHUNK_SIZE = 2000
+
+# ADMIN USER SEARCH
+# 'prefix' picks one indexed lookup from the shape of the query (an @ means email, 09... means
+# phone number, anything else a username prefix); 'contains' is django's icontains over all three
+USER_ADMIN_SEARCH_MODE = 'prefix'
+# changelist counts stop here, larger unfiltered tables use the database row estimate
+ADMIN_SEARCH_COUNT_LIMIT = 10000
+
+# USERNAMES
+# usernames of users created without one are snowflake ids; every process leases its own node id
+# (0-1023) from the SnowflakeNode table for USERNAME_NODE_LEASE_SECONDS and renews it while running
+USERNAME_NODE_LEASE_SECONDS = 600
+
+# METRICS
+# per view request latency, query count and time, template, broker publish and cache stats are
+# kept in each process and served as prometheus text on /metrics/ to these client addresses only;
+# the client is resolved through TRUSTED_PROXIES, list the reverse proxy there when it runs locally
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+# OTP PIPELINE METRICS
+# queue wait, provider latency and late deliveries of otp codes are counted in this cache so web
+# processes and celery workers share them; it must be a shared backend (redis or memcached) for the
+# numbers to add up, `manage.py check` warns about a locmem one. each process sums its samples and
+# writes them to the cache at most every OTP_METRICS_FLUSH_SECONDS and when it exits
+OTP_METRICS_CACHE_ALIAS = 'default'
+OTP_METRICS_FLUSH_SECONDS = 1
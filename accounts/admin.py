@@ -1,7 +1,11 @@
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.http import StreamingHttpResponse
+from .export import export_users
 from .forms import UserChangeForm, UserCreationForm
-from .models import User, EffortAuthenticate, OtpCode
+from .models import User, EffortAuthenticate, OtpCode, OtpOutbox, RevokedToken
+from .search import EstimatedCountPaginator, search_users
 
 
 class UserAdmin(BaseUserAdmin):
@@ -9,7 +13,7 @@ class UserAdmin(BaseUserAdmin):
     add_form = UserCreationForm
 
     list_display = ('username', 'email', 'phone_number', 'is_active', 'is_admin')
-    list_filter = ('is_active', 'is_admin')
+    list_filter = ('is_active', 'is_admin', 'created')
     readonly_fields = ('last_login', )
 
     fieldsets = (
@@ -24,6 +28,9 @@ class UserAdmin(BaseUserAdmin):
     search_fields = ('username', 'email', 'phone_number')
     ordering = ('username', )
     filter_horizontal = ('groups', 'user_permissions')
+    actions = ('export_csv', 'export_jsonl')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
@@ -34,7 +41,28 @@ class UserAdmin(BaseUserAdmin):
                 field.disabled = True
         return form
 
+    def get_search_results(self, request, queryset, search_term):
+        if settings.USER_ADMIN_SEARCH_MODE != 'prefix':
+            return super().get_search_results(request, queryset, search_term)
+        return search_users(queryset, search_term), False
+
+    def export(self, queryset, file_format):
+        content, content_type = export_users(queryset, file_format)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="users.{file_format}"'
+        return response
+
+    @admin.action(description='Export selected users as csv')
+    def export_csv(self, request, queryset):
+        return self.export(queryset, 'csv')
+
+    @admin.action(description='Export selected users as jsonl')
+    def export_jsonl(self, request, queryset):
+        return self.export(queryset, 'jsonl')
+
 
 admin.site.register(User, UserAdmin)
 admin.site.register(EffortAuthenticate)
 admin.site.register(OtpCode)
+admin.site.register(RevokedToken)
+admin.site.register(OtpOutbox)
@@ -1,10 +1,13 @@
 from django.urls import path
-from rest_framework.authtoken.views import obtain_auth_token
+from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .authentication import PasswordServiceAuthTokenSerializer
+from .views import TokenRevokeView
 
 
 urlpatterns = [
-    path('authenticate/token/', obtain_auth_token),
+    path('authenticate/token/', ObtainAuthToken.as_view(serializer_class=PasswordServiceAuthTokenSerializer)),
     path('jwt/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('jwt/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('jwt/token/revoke/', TokenRevokeView.as_view(), name='token_revoke'),
 ]
@@ -6,3 +6,6 @@ class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
     verbose_name = _('Accounts Config')
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
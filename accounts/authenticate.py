@@ -1,35 +1,59 @@
+import logging
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+from .cache import get_user_cache
 from .models import User
+from .passwords import get_password_service, PasswordServiceBusy
+from .identity import get_identity_resolver
 
 
-class UsernameAuthBackend:
-    def authenticate(self, request, username, password):
-        try:
-            user = User.objects.get(username=username)
-            if user.check_password(password):
-                return user
-            return None
-        except User.DoesNotExist:
-            return None
-
+class CachedUserMixin:
     def get_user(self, user_id):
+        return get_user_cache().get(user_id, loader=lambda: self.load_user(user_id))
+
+    def load_user(self, user_id):
         try:
             return User.objects.get(id=user_id)
         except User.DoesNotExist:
             return None
 
 
-class PhoneNumberAuthBackend:
-    def authenticate(self, request, username, password):
+logger = logging.getLogger(__name__)
+
+
+class IdentifierAuthBackend(CachedUserMixin, ModelBackend):
+    def authenticate(self, request, username=None, password=None, **kwargs):
         try:
-            user = User.objects.get(phone_number=username)
-            if user.check_password(password):
-                return user
+            return self.authenticate_password(request, username, password, **kwargs)
+        except PasswordServiceBusy:
+            # callers that can answer 503 look at the flag, the rest (e.g. the admin login) see a failed login
+            logger.warning('password service busy, login refused')
+            if request is not None:
+                request.password_service_busy = True
+            raise PermissionDenied
+
+    def authenticate_password(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
             return None
-        except User.DoesNotExist:
+        user = get_identity_resolver(request).resolve(username)
+        service = get_password_service()
+        if user is None or not user.has_usable_password():
+            # hash anyway so a missing or otp only account costs the same as a wrong password
+            service.make_password(password)
             return None
-
-    def get_user(self, user_id):
-        try:
-            return User.objects.get(id=user_id)
-        except User.DoesNotExist:
+        is_correct, upgraded = service.check_password(password, user.password)
+        if not is_correct:
             return None
+        if upgraded:
+            # stored with an older hasher or work factor; _password stays None so it isn't a password change
+            user.password = upgraded
+            user.save(update_fields=['password'])
+        if self.user_can_authenticate(user):
+            return user
+        return None
+
+    def load_user(self, user_id):
+        return ModelBackend.get_user(self, user_id)
+
@@ -0,0 +1,138 @@
+import time
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.serializers import AuthTokenSerializer
+from rest_framework import serializers
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
+from core.instrumentation import record_cache
+from .cache import get_user_cache, get_token_cache, get_verified_token_cache
+from .models import User
+from .passwords import password_service_was_busy
+from .revocation import get_revocation_list
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def load_user_id(self, key):
+        return self.get_model().objects.filter(key=key).values_list('user_id', flat=True).first()
+
+    @staticmethod
+    def load_user(user_id):
+        try:
+            return User.objects.get(id=user_id)
+        except User.DoesNotExist:
+            return None
+
+    def authenticate_credentials(self, key):
+        user_id = get_token_cache().get(key, loader=lambda: self.load_user_id(key))
+        if user_id is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        user = get_user_cache().get(user_id, loader=lambda: self.load_user(user_id))
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return user, self.get_model()(key=key, user=user)
+
+
+class PasswordServiceUnavailable(exceptions.APIException):
+    status_code = 503
+    default_detail = _('The server is busy, please try again in a moment.')
+    default_code = 'password_service_busy'
+
+
+class PasswordServiceBusyMixin:
+    # the auth backend turns a busy password pool into a failed login, answer those with 503
+    def validate(self, attrs):
+        try:
+            return super().validate(attrs)
+        except (exceptions.AuthenticationFailed, exceptions.ValidationError):
+            if password_service_was_busy(self.context.get('request')):
+                raise PasswordServiceUnavailable()
+            raise
+
+
+class PasswordServiceAuthTokenSerializer(PasswordServiceBusyMixin, AuthTokenSerializer):
+    pass
+
+
+class ClaimsTokenObtainPairSerializer(PasswordServiceBusyMixin, TokenObtainPairSerializer):
+
+    @classmethod
+    def get_token(cls, user):
+        return set_user_claims(super().get_token(user), user)
+
+
+def set_user_claims(token, user):
+    token['username'] = user.username
+    token['is_active'] = user.is_active
+    token['is_admin'] = user.is_admin
+    token['is_superuser'] = user.is_superuser
+    token['has_email'] = bool(user.email)
+    token['has_phone_number'] = bool(user.phone_number)
+    return token
+
+
+class RevocationCheckedTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if get_revocation_list().is_revoked(refresh):
+            raise InvalidToken(_('Token is revoked'))
+        # the refresh token's claims are copied into every access token, so they come from the user as it is now
+        user_id = refresh[api_settings.USER_ID_CLAIM]
+        user = get_user_cache().get(user_id, loader=lambda: CachedTokenAuthentication.load_user(user_id))
+        if user is None or not user.is_active:
+            raise InvalidToken(_('User is inactive or deleted'))
+        data = {'access': str(set_user_claims(refresh.access_token, user))}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                get_revocation_list().revoke_token(refresh)
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+    def validate(self, attrs):
+        get_revocation_list().revoke_token(RefreshToken(attrs['refresh']))
+        return {}
+
+
+class ClaimsTokenUser(TokenUser):
+    @cached_property
+    def is_active(self):
+        return self.token.get('is_active', False)
+
+    @cached_property
+    def is_admin(self):
+        return self.token.get('is_admin', False)
+
+    @cached_property
+    def is_staff(self):
+        return self.is_admin
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    def get_validated_token(self, raw_token):
+        cache = get_verified_token_cache()
+        token = cache.get(raw_token)
+        record_cache('jwt_verified', 'miss' if token is None else 'hit')
+        if token is None:
+            token = super().get_validated_token(raw_token)
+            # never serve a cached token past its own expiry
+            cache.set(raw_token, token, ttl=token['exp'] - time.time())
+        return token
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
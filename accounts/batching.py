@@ -0,0 +1,84 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+_STOP = object()
+
+
+class MicroBatcher:
+    def __init__(self, handler, max_size=100, max_wait=0.02):
+        self.handler = handler
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        # celery workers flush on shutdown through their signals, this covers every other process
+        atexit.register(self.close, 10)
+
+    def submit(self, item):
+        future = Future()
+        self._ensure_started()
+        self._queue.put((item, future))
+        return future
+
+    def close(self, timeout=None):
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                return
+            self._queue.put(_STOP)
+            thread, self._thread = self._thread, None
+        thread.join(timeout)
+
+    def _ensure_started(self):
+        # a forked worker inherits the object but not the flushing thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, args=(self._queue, ), daemon=True)
+                self._thread.start()
+
+    def _run(self, pending):
+        while True:
+            entry = pending.get()
+            if entry is _STOP:
+                return
+            batch = [entry]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = pending.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stop = True
+                    break
+                batch.append(entry)
+            self._flush(batch)
+            if stop:
+                return
+
+    def _flush(self, batch):
+        try:
+            results = self.handler([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        results = list(results)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+        for _, future in batch[len(results):]:
+            future.set_exception(RuntimeError(f'handler returned {len(results)} results for {len(batch)} items'))
@@ -0,0 +1,128 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import caches
+from core.instrumentation import record_cache
+
+
+MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, MISSING)
+            if entry is MISSING:
+                return default
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TieredCache:
+    def __init__(self, prefix, timeout=300, local_size=1024, local_ttl=5, alias='default'):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.local = LRUCache(maxsize=local_size, ttl=local_ttl)
+        self.shared = caches[alias]
+
+    def make_key(self, key):
+        return f'{self.prefix}:{key}'
+
+    def get(self, key, loader=None):
+        value = self.local.get(key, MISSING)
+        if value is MISSING:
+            # entries carry the generation they were loaded under; delete() bumps it, so a fill that
+            # read the row before a concurrent save landed is never served
+            cache_key, generation_key = self.make_key(key), self.make_key(key) + ':generation'
+            stored = self.shared.get_many([cache_key, generation_key])
+            generation, entry = stored.get(generation_key), stored.get(cache_key)
+            if generation is not None and isinstance(entry, tuple) and entry[0] == generation:
+                value = entry[1]
+                record_cache(self.prefix, 'shared_hit')
+            else:
+                record_cache(self.prefix, 'miss')
+                if loader is None:
+                    return None
+                if generation is None:
+                    generation = self.new_generation(generation_key)
+                value = loader()
+                if value is None:
+                    return None
+                self.shared.set(cache_key, (generation, value), self.timeout)
+            self.local.set(key, value)
+        else:
+            record_cache(self.prefix, 'local_hit')
+        # callers get their own copy so per-request state never leaks between requests
+        return copy.copy(value)
+
+    def new_generation(self, generation_key):
+        # entries are only served under a generation key that still exists, so when it expires or is
+        # evicted the entries stored under it become misses instead of matching a missing generation
+        generation = uuid.uuid4().hex
+        if self.shared.add(generation_key, generation, self.timeout):
+            return generation
+        return self.shared.get(generation_key) or generation
+
+    def delete(self, key):
+        # a fresh random generation can't match any entry stored before; it lives as long as an entry
+        self.shared.set(self.make_key(key) + ':generation', uuid.uuid4().hex, self.timeout)
+        self.local.delete(key)
+        self.shared.delete(self.make_key(key))
+
+
+@lru_cache(maxsize=None)
+def get_user_cache():
+    return TieredCache(
+        'user',
+        timeout=settings.USER_CACHE_TIMEOUT,
+        local_size=settings.USER_CACHE_LOCAL_SIZE,
+        local_ttl=settings.USER_CACHE_LOCAL_TTL,
+        alias=settings.USER_CACHE_ALIAS,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_token_cache():
+    return TieredCache(
+        'auth_token',
+        timeout=settings.TOKEN_CACHE_TIMEOUT,
+        local_size=settings.TOKEN_CACHE_LOCAL_SIZE,
+        local_ttl=settings.TOKEN_CACHE_LOCAL_TTL,
+        alias=settings.USER_CACHE_ALIAS,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_verified_token_cache():
+    return LRUCache(maxsize=settings.JWT_VERIFIED_CACHE_SIZE)
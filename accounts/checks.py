@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Warning, register
+
+
+@register()
+def check_otp_metrics_cache(app_configs, **kwargs):
+    # a locmem cache is per process, /metrics/ would report whichever process answered
+    if not isinstance(caches[settings.OTP_METRICS_CACHE_ALIAS], LocMemCache):
+        return []
+    return [Warning(
+        'OTP_METRICS_CACHE_ALIAS points at a process local cache, the otp pipeline metrics are not shared.',
+        hint='Use a redis or memcached cache shared by the web processes and the celery workers.',
+        id='accounts.W001',
+    )]
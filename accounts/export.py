@@ -0,0 +1,53 @@
+import csv
+import json
+from django.conf import settings
+
+
+EXPORT_FIELDS = ('id', 'username', 'email', 'phone_number', 'is_active', 'is_admin', 'created')
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def filter_users(queryset, is_active=None, is_admin=None, created_from=None, created_to=None):
+    if is_active is not None:
+        queryset = queryset.filter(is_active=is_active)
+    if is_admin is not None:
+        queryset = queryset.filter(is_admin=is_admin)
+    if created_from is not None:
+        queryset = queryset.filter(created__gte=created_from)
+    if created_to is not None:
+        queryset = queryset.filter(created__lt=created_to)
+    return queryset
+
+
+def iter_users(queryset, chunk_size=None):
+    # only the exported columns are fetched and rows are streamed from the cursor, never cached
+    rows = queryset.order_by('pk').values_list(*EXPORT_FIELDS)
+    for row in rows.iterator(chunk_size=chunk_size or settings.USER_EXPORT_CHUNK_SIZE):
+        yield dict(zip(EXPORT_FIELDS, row), created=row[-1].isoformat())
+
+
+def stream_csv(rows):
+    writer = csv.DictWriter(Echo(), fieldnames=EXPORT_FIELDS)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+STREAMERS = {
+    'csv': (stream_csv, 'text/csv'),
+    'jsonl': (stream_jsonl, 'application/x-ndjson'),
+}
+
+
+def export_users(queryset, file_format='csv', chunk_size=None):
+    streamer, content_type = STREAMERS[file_format]
+    return streamer(iter_users(queryset, chunk_size)), content_type
@@ -3,12 +3,23 @@ from datetime import datetime
 from django import forms
 from django.contrib.auth.forms import ReadOnlyPasswordHashField
 from django.utils.translation import gettext_lazy as _
-from .models import User, OtpCode
+from .models import User
 from django.contrib.auth import authenticate, login
 from .validators import check_phone_number
+from .phone import normalize_phone_number
 from django.contrib import messages
 from django.core.validators import validate_email
-from convert_numbers import persian_to_english
+from .otp import get_otp_store, OTP_SESSION_KEY
+from .passwords import password_service_was_busy, PasswordServiceBusy
+from .identity import classify, get_identity_resolver, USERNAME, EMAIL, PHONE_NUMBER
+from .throttling import get_login_throttle, get_client_ip
+
+
+class PhoneNumberField(forms.CharField):
+    default_validators = [check_phone_number]
+
+    def to_python(self, value):
+        return normalize_phone_number(super().to_python(value))
 
 
 class UserCreationForm(forms.ModelForm):
@@ -18,6 +29,7 @@ class UserCreationForm(forms.ModelForm):
     class Meta:
         model = User
         fields = ('username', 'email', 'phone_number')
+        field_classes = {'phone_number': PhoneNumberField}
 
     def clean_password2(self):
         cd = self.cleaned_data
@@ -39,6 +51,14 @@ class UserChangeForm(forms.ModelForm):
     class Meta:
         model = User
         fields = ('username', 'email', 'phone_number', 'last_login')
+        field_classes = {'phone_number': PhoneNumberField}
+
+
+class RequestForm(forms.Form):
+    # identity lookups go through the request's resolver so one request never repeats them
+    def __init__(self, request=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.request = request
 
 
 class UserLoginUsernameForm(forms.Form):
@@ -58,14 +78,22 @@ class UserLoginUsernameForm(forms.Form):
     def clean(self):
         cd = self.cleaned_data
         if cd.get('username') and cd.get('password'):
-            user = authenticate(username=cd.get('username'), password=cd.get('password'))
+            username, ip = cd.get('username'), get_client_ip(self.request)
+            throttle = get_login_throttle()
+            if throttle.is_locked(username, ip):
+                raise forms.ValidationError(_('too many failed login attempts, please try again later.'))
+            user = authenticate(self.request, username=username, password=cd.get('password'))
+            if not user and password_service_was_busy(self.request):
+                raise PasswordServiceBusy()
             if not user:
+                throttle.register_failure(username, ip, get_identity_resolver(self.request).resolve(username))
                 raise forms.ValidationError(_('not found any account with information'))
+            throttle.register_success(username)
             login(self.request, user)
         return cd
 
 
-class UserRegisterUsernameForm(forms.Form):
+class UserRegisterUsernameForm(RequestForm):
     username = forms.CharField(widget=forms.TextInput(attrs={"placeholder": _('username')}))
     password = forms.CharField(widget=forms.PasswordInput(attrs={"placeholder": _('password')}))
 
@@ -73,7 +101,9 @@ class UserRegisterUsernameForm(forms.Form):
         username = self.cleaned_data.get('username')
         if len(username) > 32:
             raise forms.ValidationError(_('username must less than 32 chars.'))
-        elif User.objects.filter(username=username).exists():
+        elif classify(username) != USERNAME:
+            raise forms.ValidationError(_('username can not be an email or a phone number.'))
+        elif get_identity_resolver(self.request).exists(username, USERNAME):
             raise forms.ValidationError(_('this username already exist.'))
         return username
 
@@ -84,50 +114,42 @@ class UserRegisterUsernameForm(forms.Form):
         return password
 
 
-class UserLoginPhoneNumberForm(forms.Form):
-    phone_number = forms.CharField(
-        widget=forms.TextInput(attrs={"placeholder": _('Phone number')}), validators=[check_phone_number]
-    )
+class UserLoginPhoneNumberForm(RequestForm):
+    phone_number = PhoneNumberField(widget=forms.TextInput(attrs={"placeholder": _('Phone number')}))
 
     def clean_phone_number(self):
-        phone = persian_to_english(self.cleaned_data.get('phone_number'))
-        user = User.objects.filter(phone_number=phone).exists()
-        if not user:
+        phone = self.cleaned_data.get('phone_number')
+        if not get_identity_resolver(self.request).exists(phone, PHONE_NUMBER):
             raise forms.ValidationError(_('This phone number does not exist.'))
         return phone
 
 
-class UserRegisterPhoneNumberForm(forms.Form):
-    phone_number = forms.CharField(
-        widget=forms.TextInput(attrs={"placeholder": _('Phone number')}), validators=[check_phone_number]
-    )
+class UserRegisterPhoneNumberForm(RequestForm):
+    phone_number = PhoneNumberField(widget=forms.TextInput(attrs={"placeholder": _('Phone number')}))
 
     def clean_phone_number(self):
-        phone_number = persian_to_english(self.cleaned_data.get('phone_number'))
-        user = User.objects.filter(phone_number=phone_number).exists()
-        if user:
+        phone_number = self.cleaned_data.get('phone_number')
+        if get_identity_resolver(self.request).exists(phone_number, PHONE_NUMBER):
             raise forms.ValidationError(_('This phone number already exist.'))
         return phone_number
 
 
-class UserLoginEmailForm(forms.Form):
+class UserLoginEmailForm(RequestForm):
     email = forms.EmailField(widget=forms.EmailInput(attrs={"placeholder": _('email')}))
 
     def clean_email(self):
         email = self.cleaned_data.get('email')
-        user = User.objects.filter(email=email).exists()
-        if not user:
+        if not get_identity_resolver(self.request).exists(email, EMAIL):
             raise forms.ValidationError(_('This email does not exist'))
         return email
 
 
-class UserRegisterEmailForm(forms.Form):
+class UserRegisterEmailForm(RequestForm):
     email = forms.EmailField(widget=forms.EmailInput(attrs={"class": _('email')}))
 
     def clean_email(self):
         email = self.cleaned_data.get('email')
-        user = User.objects.filter(email=email).exists()
-        if user:
+        if get_identity_resolver(self.request).exists(email, EMAIL):
             raise forms.ValidationError(_('This email already exist.'))
         return email
 
@@ -143,36 +165,36 @@ class VerifyOtpCodeForm(forms.Form):
         code = self.cleaned_data.get('code')
         if len(code) < 4 or len(code) > 4:
             raise forms.ValidationError(_('invalid code.'))
-        otp_code = OtpCode.objects.filter(code=code)
-        if not otp_code.exists():
+        otp_code = get_otp_store().pop(code, self.request.session.get(OTP_SESSION_KEY))
+        if otp_code is None:
             raise forms.ValidationError(_('invalid code.'))
-        otp_code = otp_code.last()
         if otp_code.expire_time < datetime.now():
             raise forms.ValidationError(_('Expiration time is over'))
         else:
+            self.request.session.pop(OTP_SESSION_KEY, None)
+            resolver = get_identity_resolver(self.request)
             if otp_code.phone_number:
-                user = User.objects.filter(phone_number=otp_code.phone_number)
-                if user.exists():
-                    login(self.request, user[0], backend='accounts.authenticate.PhoneNumberAuthBackend')
+                user = resolver.resolve(otp_code.phone_number, PHONE_NUMBER)
+                if user:
+                    login(self.request, user, backend='accounts.authenticate.IdentifierAuthBackend')
                     messages.success(self.request, _('You have successfully logged in via your mobile number.'))
                 else:
                     user = User.objects.create_user(phone_number=otp_code.phone_number)
-                    login(self.request, user, backend='accounts.authenticate.PhoneNumberAuthBackend')
+                    login(self.request, user, backend='accounts.authenticate.IdentifierAuthBackend')
                     messages.success(self.request, _('You have successfully registered via your mobile number.'))
             if otp_code.email:
-                user = User.objects.filter(email=otp_code.email)
-                if user.exists():
-                    login(self.request, user[0], backend='django.contrib.auth.backends.ModelBackend')
+                user = resolver.resolve(otp_code.email, EMAIL)
+                if user:
+                    login(self.request, user, backend='accounts.authenticate.IdentifierAuthBackend')
                     messages.success(self.request, _('You have successfully logged in via your email.'))
                 else:
                     user = User.objects.create_user(email=otp_code.email)
-                    login(self.request, user, backend='django.contrib.auth.backends.ModelBackend')
+                    login(self.request, user, backend='accounts.authenticate.IdentifierAuthBackend')
                     messages.success(self.request, _('You have successfully registered via your email'))
-            otp_code.delete()
         return code
 
 
-class UserLoginCombineForm(forms.Form):
+class UserLoginCombineForm(RequestForm):
     info = forms.CharField(widget=forms.TextInput(attrs={"placeholder": _('Email or Phone number')}))
 
     def clean_info(self):
@@ -182,20 +204,18 @@ class UserLoginCombineForm(forms.Form):
                 validate_email(info)
             except:
                 return validate_email(info)
-            user = User.objects.filter(email=info).exists()
-            if not user:
+            if not get_identity_resolver(self.request).exists(info, EMAIL):
                 raise forms.ValidationError(_('not found any account with information'))
         else:
-            info = persian_to_english(info)
+            info = normalize_phone_number(info)
             if info:
                 check_phone_number(info)
-            user = User.objects.filter(phone_number=info).exists()
-            if not user:
+            if not get_identity_resolver(self.request).exists(info, PHONE_NUMBER):
                 raise forms.ValidationError(_('not found any account with information'))
         return info
 
 
-class UserRegisterCombineForm(forms.Form):
+class UserRegisterCombineForm(RequestForm):
     info = forms.CharField(widget=forms.TextInput(attrs={"placeholder": _('Email or Phone number')}))
 
     def clean_info(self):
@@ -205,14 +225,12 @@ class UserRegisterCombineForm(forms.Form):
                 validate_email(info)
             except:
                 return validate_email(info)
-            user = User.objects.filter(email=info).exists()
-            if user:
+            if get_identity_resolver(self.request).exists(info, EMAIL):
                 raise forms.ValidationError(_('This email already exist.'))
         else:
-            info = persian_to_english(info)
+            info = normalize_phone_number(info)
             if info:
                 check_phone_number(info)
-            user = User.objects.filter(phone_number=info).exists()
-            if user:
+            if get_identity_resolver(self.request).exists(info, PHONE_NUMBER):
                 raise forms.ValidationError(_('This phone number already exist.'))
         return info
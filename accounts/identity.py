@@ -0,0 +1,63 @@
+from django.contrib.auth.models import BaseUserManager
+from .models import User
+from .phone import normalize_phone_number, is_phone_number
+
+
+USERNAME = 'username'
+EMAIL = 'email'
+PHONE_NUMBER = 'phone_number'
+
+
+def classify(identifier):
+    if '@' in identifier:
+        return EMAIL
+    if is_phone_number(normalize_phone_number(identifier)):
+        return PHONE_NUMBER
+    return USERNAME
+
+
+def normalize(identifier, kind):
+    identifier = identifier.strip()
+    if kind == EMAIL:
+        return BaseUserManager.normalize_email(identifier)
+    if kind == PHONE_NUMBER:
+        return normalize_phone_number(identifier)
+    return identifier
+
+
+class IdentityResolver:
+    def __init__(self):
+        self._users = {}
+
+    def resolve(self, identifier, kind=None):
+        if not identifier:
+            return None
+        if kind is not None:
+            return self.lookup(identifier, kind)
+        kind = classify(identifier)
+        user = self.lookup(identifier, kind)
+        if user is None and kind != USERNAME:
+            # usernames taken before registration refused these shapes may look like an email or phone number
+            user = self.lookup(identifier, USERNAME)
+        return user
+
+    def lookup(self, identifier, kind):
+        key = (kind, normalize(identifier, kind))
+        if key not in self._users:
+            try:
+                self._users[key] = User.objects.get(**{key[0]: key[1]})
+            except User.DoesNotExist:
+                self._users[key] = None
+        return self._users[key]
+
+    def exists(self, identifier, kind=None):
+        return self.resolve(identifier, kind) is not None
+
+
+def get_identity_resolver(request=None):
+    if request is None:
+        return IdentityResolver()
+    resolver = getattr(request, '_identity_resolver', None)
+    if resolver is None:
+        resolver = request._identity_resolver = IdentityResolver()
+    return resolver
@@ -0,0 +1,91 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from functools import lru_cache
+from django.apps import apps
+from django.conf import settings
+
+
+EPOCH = 1704067200000  # 2024-01-01 UTC, in milliseconds
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+def lease_node_id(owner, seconds):
+    # the model module imports this one through its managers
+    return apps.get_model('accounts', 'SnowflakeNode').objects.lease(owner, MAX_NODE + 1, seconds)
+
+
+def renew_node_id(node_id, owner, seconds):
+    return apps.get_model('accounts', 'SnowflakeNode').objects.renew(node_id, owner, seconds)
+
+
+# 63 bit ids: 41 bits of milliseconds since EPOCH, 10 bits of node and 12 bits of sequence, so they
+# are unique as long as no two live processes share a node id and increase within a process. without
+# an explicit node id every process leases one from the SnowflakeNode table and renews it halfway
+# through the lease; a lease lost while the process stalled is replaced before the next id is made
+class SnowflakeGenerator:
+    def __init__(self, node_id=None, epoch=EPOCH, lease_seconds=600):
+        if node_id is not None and not 0 <= node_id <= MAX_NODE:
+            raise ValueError(f'node id must be between 0 and {MAX_NODE}.')
+        self.node_id = node_id
+        self.epoch = epoch
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._pid = None
+        self._node = None
+        self._owner = None
+        self._renew_at = 0
+        self._last = -1
+        self._sequence = 0
+
+    def _current_node(self):
+        if self.node_id is not None:
+            return self.node_id
+        now = time.monotonic()
+        if self._pid != os.getpid():
+            # a forked child must not share its parent's node
+            self._pid = os.getpid()
+            self._owner = f'{socket.gethostname()}:{self._pid}:{uuid.uuid4().hex[:8]}'
+            self._node = lease_node_id(self._owner, self.lease_seconds)
+            self._renew_at = now + self.lease_seconds / 2
+        elif now >= self._renew_at:
+            if not renew_node_id(self._node, self._owner, self.lease_seconds):
+                self._node = lease_node_id(self._owner, self.lease_seconds)
+            self._renew_at = now + self.lease_seconds / 2
+        return self._node
+
+    def reserve(self, count):
+        with self._lock:
+            self._node = self._current_node()
+            now = int(time.time() * 1000) - self.epoch
+            if now > self._last:
+                self._last, self._sequence = now, 0
+            ids = []
+            for _ in range(count):
+                if self._sequence > MAX_SEQUENCE:
+                    # sequence exhausted, borrow the next millisecond instead of sleeping
+                    self._last, self._sequence = self._last + 1, 0
+                ids.append((self._last << (NODE_BITS + SEQUENCE_BITS)) | (self._node << SEQUENCE_BITS) | self._sequence)
+                self._sequence += 1
+            return ids
+
+    def next_id(self):
+        return self.reserve(1)[0]
+
+
+@lru_cache(maxsize=None)
+def get_username_generator():
+    return SnowflakeGenerator(lease_seconds=settings.USERNAME_NODE_LEASE_SECONDS)
+
+
+def allocate_username():
+    return str(get_username_generator().next_id())
+
+
+def reserve_usernames(count):
+    return [str(value) for value in get_username_generator().reserve(count)]
@@ -0,0 +1,57 @@
+import smtplib
+import threading
+from functools import lru_cache
+from django.conf import settings
+from django.core.mail import get_connection
+from .batching import MicroBatcher
+
+
+class PersistentMailConnection:
+    reconnect_errors = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+    def __init__(self):
+        self.connection = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self.connection is None:
+            connection = get_connection(fail_silently=False)
+            connection.open()
+            self.connection = connection
+        return self.connection
+
+    def _close(self):
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def send_messages(self, messages):
+        with self._lock:
+            try:
+                return self._open().send_messages(messages)
+            except self.reconnect_errors:
+                # the server dropped an idle session, retry once on a fresh one
+                self._close()
+                return self._open().send_messages(messages)
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+@lru_cache(maxsize=None)
+def get_mail_connection():
+    return PersistentMailConnection()
+
+
+def send_mail_batch(messages):
+    sent = get_mail_connection().send_messages(messages)
+    return [True] * sent + [False] * (len(messages) - sent)
+
+
+@lru_cache(maxsize=None)
+def get_mail_batcher():
+    return MicroBatcher(send_mail_batch, max_size=settings.MAIL_BATCH_SIZE, max_wait=settings.MAIL_BATCH_WAIT_MS / 1000)
@@ -0,0 +1,79 @@
+import random
+import time
+import uuid
+from django.contrib import admin
+from django.contrib.auth.hashers import make_password
+from django.core.paginator import Paginator
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Time admin user searches in the prefix and the contains search mode.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000, help='users inserted before the run, rolled back after')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['users'])
+            request = RequestFactory().get(reverse('admin:accounts_user_changelist'))
+            request.user = User(is_admin=True, is_superuser=True)
+            model_admin = admin.site._registry[User]
+            sample = User.objects.order_by('?').first()
+            terms = {
+                'username prefix': sample.username[:6],
+                'email': sample.email,
+                'email prefix': sample.email.split('@')[0] + '@',
+                'phone number': sample.phone_number,
+                'phone prefix': sample.phone_number[:6],
+            }
+            for mode in ('contains', 'prefix'):
+                with override_settings(USER_ADMIN_SEARCH_MODE=mode):
+                    for name, term in terms.items():
+                        self.run(model_admin, request, mode, name, term, options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        password = make_password(None)
+        start = random.randint(100000000, 800000000)
+        batch = []
+        for i in range(count):
+            batch.append(User(
+                username=uuid.uuid4().hex[:16],
+                email=f'user{start + i}@example.com',
+                phone_number=f'09{start + i:09d}',
+                password=password,
+            ))
+            if len(batch) == 5000:
+                User.objects.bulk_create(batch)
+                batch = []
+        User.objects.bulk_create(batch)
+
+    @staticmethod
+    def search(model_admin, request, mode, term):
+        # the database work of one changelist request: search, count and the first page
+        queryset, _ = model_admin.get_search_results(request, User.objects.order_by('username'), term)
+        if mode == 'prefix':
+            paginator = model_admin.get_paginator(request, queryset, model_admin.list_per_page)
+        else:
+            paginator = Paginator(queryset, model_admin.list_per_page)
+            User.objects.count()
+        list(paginator.get_page(1))
+        return paginator.count
+
+    def run(self, model_admin, request, mode, name, term, repeat):
+        with CaptureQueriesContext(connection) as queries:
+            found = self.search(model_admin, request, mode, term)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            self.search(model_admin, request, mode, term)
+        elapsed = (time.perf_counter() - start) / repeat * 1000
+        self.stdout.write(
+            f'{mode:>8} {name:>16} {term!r:>30}: {elapsed:8.2f} ms, {found} found, {len(queries)} queries'
+        )
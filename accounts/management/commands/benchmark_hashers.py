@@ -0,0 +1,62 @@
+import statistics
+import time
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Measure the password hashers on this machine and suggest work factors for a target latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=100)
+        parser.add_argument('--samples', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.samples = options['samples']
+        target = options['target_ms'] / 1000
+        self.calibrate_pbkdf2(target)
+        self.calibrate_argon2(target)
+
+    def measure(self, hasher):
+        salt = hasher.salt()
+        timings = []
+        for _ in range(self.samples):
+            start = time.perf_counter()
+            hasher.encode('benchmark password', salt)
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
+
+    def report(self, name, elapsed):
+        self.stdout.write(f'{name}: {elapsed * 1000:.1f} ms per hash, {1 / elapsed:.1f} hashes/s per core')
+
+    def calibrate_pbkdf2(self, target):
+        hasher = PBKDF2PasswordHasher()
+        hasher.iterations = settings.PASSWORD_PBKDF2_ITERATIONS
+        self.report(f'pbkdf2 current ({hasher.iterations} iterations)', self.measure(hasher))
+        # pbkdf2 is linear in its iterations, so one probe is enough to extrapolate
+        hasher.iterations = 50000
+        per_iteration = self.measure(hasher) / hasher.iterations
+        hasher.iterations = max(1000, round(target / per_iteration / 1000) * 1000)
+        self.report(f'pbkdf2 suggested ({hasher.iterations} iterations)', self.measure(hasher))
+        self.stdout.write(self.style.SUCCESS(f'PASSWORD_PBKDF2_ITERATIONS = {hasher.iterations}'))
+
+    def calibrate_argon2(self, target):
+        hasher = Argon2PasswordHasher()
+        try:
+            hasher._load_library()
+        except ValueError:
+            self.stdout.write('argon2: skipped, argon2-cffi is not installed')
+            return
+        hasher.memory_cost = settings.PASSWORD_ARGON2_MEMORY_COST
+        hasher.parallelism = settings.PASSWORD_ARGON2_PARALLELISM
+        hasher.time_cost = settings.PASSWORD_ARGON2_TIME_COST
+        self.report(f'argon2 current (time cost {hasher.time_cost})', self.measure(hasher))
+        # memory cost is kept, time cost is raised until a hash takes the target latency
+        hasher.time_cost = 1
+        elapsed = self.measure(hasher)
+        while elapsed < target:
+            hasher.time_cost += 1
+            elapsed = self.measure(hasher)
+        self.report(f'argon2 suggested (time cost {hasher.time_cost})', elapsed)
+        self.stdout.write(self.style.SUCCESS(f'PASSWORD_ARGON2_TIME_COST = {hasher.time_cost}'))
@@ -0,0 +1,28 @@
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from accounts.authentication import ClaimsTokenObtainPairSerializer, StatelessJWTAuthentication
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Compare requests per second of the database backed and the stateless jwt authentication.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create_user(username=f'bench-{uuid.uuid4().hex[:16]}')
+            token = ClaimsTokenObtainPairSerializer.get_token(user).access_token
+            request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+            for name, authentication in (('database', JWTAuthentication()), ('stateless', StatelessJWTAuthentication())):
+                start = time.perf_counter()
+                for _ in range(options['requests']):
+                    authentication.authenticate(request)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'{name:>9}: {options["requests"] / elapsed:.0f} requests/s')
+            transaction.set_rollback(True)
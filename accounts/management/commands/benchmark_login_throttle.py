@@ -0,0 +1,55 @@
+import time
+import uuid
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from accounts.models import User
+from accounts.throttling import LoginThrottle
+
+
+class Command(BaseCommand):
+    help = 'Replay a password guessing attack with and without the login throttle and compare cpu time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=200)
+        parser.add_argument('--ips', type=int, default=4)
+
+    def handle(self, *args, **options):
+        attempts, ips = options['attempts'], [f'203.0.113.{i + 1}' for i in range(options['ips'])]
+        username = f'bench-{uuid.uuid4().hex[:16]}'
+        with transaction.atomic():
+            User.objects.create_user(username=username, password=uuid.uuid4().hex)
+
+            start = time.process_time()
+            for i in range(attempts):
+                authenticate(None, username=username, password=f'guess-{i}')
+            self.report('unthrottled', attempts, attempts, time.process_time() - start)
+
+            throttle = LoginThrottle(
+                window=settings.LOGIN_THROTTLE_WINDOW,
+                user_limit=settings.LOGIN_THROTTLE_USER_LIMIT,
+                ip_limit=settings.LOGIN_THROTTLE_IP_LIMIT,
+                lock_seconds=60,
+                alias=settings.LOGIN_THROTTLE_CACHE_ALIAS,
+                on_lockout=None,
+            )
+            hashed = 0
+            start = time.process_time()
+            for i in range(attempts):
+                ip = ips[i % len(ips)]
+                if throttle.is_locked(username, ip):
+                    continue
+                hashed += 1
+                if not authenticate(None, username=username, password=f'guess-{i}'):
+                    throttle.register_failure(username, ip)
+            self.report('throttled', attempts, hashed, time.process_time() - start)
+            transaction.set_rollback(True)
+
+        keys = [throttle.identity_key(username)] + [throttle.ip_key(ip) for ip in ips]
+        throttle.cache.delete_many([throttle.lock_key(key) for key in keys])
+        for key in keys:
+            throttle.counter.reset(key)
+
+    def report(self, mode, attempts, hashed, cpu):
+        self.stdout.write(f'{mode:>11}: {attempts} attempts, {hashed} password hashes, {cpu:.2f}s cpu')
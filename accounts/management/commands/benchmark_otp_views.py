@@ -0,0 +1,95 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from django.core.management.base import BaseCommand
+from django.test import Client, AsyncClient, override_settings
+from django.urls import reverse
+from A.celery_conf import celery_app
+from accounts.models import OtpOutbox
+from accounts.sms import get_sms_provider
+from accounts.throttling import get_otp_rate_limiter
+
+
+FORM = 'application/x-www-form-urlencoded'
+
+
+class Command(BaseCommand):
+    help = 'Load test the otp register view through the wsgi and the asgi handler.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--publish-latency-ms', type=float, default=20)
+        parser.add_argument(
+            '--delivery-mode', choices=('direct', 'outbox'), default='direct',
+            help='outbox writes real OtpOutbox rows, only use it on a database no relay or beat worker reads',
+        )
+
+    def handle(self, *args, **options):
+        overrides = override_settings(
+            SESSION_ENGINE='django.contrib.sessions.backends.cache',
+            SMS_PROVIDER='accounts.sms.StubSmsProvider',
+            SMS_STUB_LATENCY_MS=options['publish_latency_ms'],
+            SMS_DELIVERY_MODE='direct',
+            OTP_DELIVERY_MODE=options['delivery_mode'],
+            OTP_IP_BURST=options['requests'] * 2,
+            OTP_DESTINATION_BURST=options['requests'] * 2,
+        )
+        eager = celery_app.conf.task_always_eager
+        # eager tasks hit the stub provider inline, standing in for a broker round-trip
+        celery_app.conf.task_always_eager = True
+        last_message = OtpOutbox.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        try:
+            with overrides:
+                self.reset()
+                start = random.randint(100000000, 800000000)
+                numbers = [f'09{start + i:09d}' for i in range(options['requests'])]
+                self.run('wsgi', self.run_wsgi, reverse('accounts:register_phone_number'), numbers, options)
+                numbers = [f'09{start + len(numbers) + i:09d}' for i in range(options['requests'])]
+                self.run('asgi', self.run_asgi, reverse('accounts:async_register_phone_number'), numbers, options)
+        finally:
+            celery_app.conf.task_always_eager = eager
+            self.reset()
+            # the benchmark numbers must never reach a relay
+            OtpOutbox.objects.filter(pk__gt=last_message).delete()
+
+    @staticmethod
+    def reset():
+        get_sms_provider.cache_clear()
+        get_otp_rate_limiter.cache_clear()
+
+    def run(self, name, runner, url, numbers, options):
+        start = time.perf_counter()
+        statuses = runner(url, numbers, options['concurrency'])
+        elapsed = time.perf_counter() - start
+        ok = sum(1 for status in statuses if status == 302)
+        self.stdout.write(f'{name}: {len(statuses)} requests, {ok} ok, {elapsed:.2f}s, {len(statuses) / elapsed:.0f} req/s')
+
+    @staticmethod
+    def run_wsgi(url, numbers, concurrency):
+        local = threading.local()
+
+        def post(number):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            return local.client.post(url, urlencode({'phone_number': number}), content_type=FORM).status_code
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            return list(executor.map(post, numbers))
+
+    @staticmethod
+    def run_asgi(url, numbers, concurrency):
+        async def run():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def post(number):
+                async with semaphore:
+                    response = await AsyncClient().post(url, urlencode({'phone_number': number}), content_type=FORM)
+                    return response.status_code
+
+            return await asyncio.gather(*(post(number) for number in numbers))
+
+        return asyncio.run(run())
@@ -0,0 +1,38 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from accounts.passwords import PasswordService
+
+
+class Command(BaseCommand):
+    help = 'Compare login password checks per second inline on request threads and in the process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=32, help='concurrent request threads')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='pool processes')
+
+    def handle(self, *args, **options):
+        encoded = make_password('benchmark password')
+        cores = os.cpu_count()
+        services = (
+            ('inline', PasswordService(workers=0)),
+            ('pool', PasswordService(workers=options['workers'], max_pending=options['threads'])),
+        )
+        for name, service in services:
+            # warm the pool up so process start-up isn't measured
+            service.check_password('benchmark password', encoded)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(options['threads']) as executor:
+                results = list(executor.map(
+                    lambda _: service.check_password('benchmark password', encoded)[0], range(options['logins'])
+                ))
+            elapsed = time.perf_counter() - start
+            service.shutdown()
+            rate = options['logins'] / elapsed
+            self.stdout.write(
+                f'{name:>6}: {sum(results)}/{len(results)} valid, {rate:.1f} logins/s, {rate / cores:.1f} per core '
+                f'({cores} cores)'
+            )
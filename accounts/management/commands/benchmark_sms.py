@@ -0,0 +1,45 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from accounts.batching import MicroBatcher
+from accounts.sms import StubSmsProvider
+
+
+class Command(BaseCommand):
+    help = 'Measure sms delivery throughput of direct and batch mode against the stub provider.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--latency-ms', type=float, default=settings.SMS_STUB_LATENCY_MS)
+        parser.add_argument('--batch-size', type=int, default=settings.SMS_BATCH_SIZE)
+        parser.add_argument('--batch-wait-ms', type=float, default=settings.SMS_BATCH_WAIT_MS)
+
+    def handle(self, *args, **options):
+        messages = [(f'09{i:09d}', str(1000 + i % 9000)) for i in range(options['messages'])]
+        latency = options['latency_ms'] / 1000
+
+        provider = StubSmsProvider(latency=latency)
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            start = time.perf_counter()
+            list(executor.map(lambda m: provider.send(*m), messages))
+            elapsed = time.perf_counter() - start
+        self.report('direct', len(messages), provider.requests, elapsed)
+
+        provider = StubSmsProvider(latency=latency)
+        batcher = MicroBatcher(
+            provider.send_bulk, max_size=options['batch_size'], max_wait=options['batch_wait_ms'] / 1000
+        )
+        start = time.perf_counter()
+        futures = [batcher.submit(message) for message in messages]
+        wait(futures)
+        elapsed = time.perf_counter() - start
+        batcher.close()
+        self.report('batch', len(messages), provider.requests, elapsed)
+
+    def report(self, mode, count, requests, elapsed):
+        self.stdout.write(
+            f'{mode:>6}: {count} messages, {requests} provider requests, '
+            f'{elapsed:.2f}s, {count / elapsed:.0f} messages/s'
+        )
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from accounts.models import OtpCode, OtpOutbox
+
+
+class Command(BaseCommand):
+    help = 'Delete expired otp codes and outbox messages in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.OTP_SWEEP_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        deleted = OtpCode.objects.delete_expired(batch_size=options['batch_size'])
+        dropped = OtpOutbox.objects.delete_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{deleted} expired otp codes and {dropped} outbox messages deleted.'))
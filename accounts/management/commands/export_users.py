@@ -0,0 +1,64 @@
+import sys
+from datetime import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date, parse_datetime
+from accounts.export import export_users, filter_users
+from accounts.models import User
+
+
+def parse_bool(value):
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(value)
+
+
+def parse_time(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(value)
+        moment = datetime.combine(date, datetime.min.time())
+    return moment
+
+
+class Command(BaseCommand):
+    help = 'Stream users to a csv or jsonl file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help='file path, - for stdout')
+        parser.add_argument('--format', choices=('csv', 'jsonl'))
+        parser.add_argument('--is-active', type=parse_bool)
+        parser.add_argument('--is-admin', type=parse_bool)
+        parser.add_argument('--created-from', type=parse_time, help='inclusive, date or datetime')
+        parser.add_argument('--created-to', type=parse_time, help='exclusive, date or datetime')
+        parser.add_argument('--chunk-size', type=int, default=settings.USER_EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['output']
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        queryset = filter_users(
+            User.objects.all(),
+            is_active=options['is_active'],
+            is_admin=options['is_admin'],
+            created_from=options['created_from'],
+            created_to=options['created_to'],
+        )
+        content, _ = export_users(queryset, file_format, options['chunk_size'])
+        try:
+            stream = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError(e)
+        count = -1 if file_format == 'csv' else 0
+        try:
+            for line in content:
+                stream.write(line)
+                count += 1
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        if stream is not sys.stdout:
+            self.stdout.write(self.style.SUCCESS(f'{count} users exported to {path}'))
@@ -0,0 +1,190 @@
+import csv
+import io
+import json
+import os
+import time
+import django
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import BaseUserManager
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from accounts.ids import reserve_usernames
+from accounts.models import User
+from accounts.phone import normalize_phone_number
+from accounts.validators import check_phone_number
+
+
+FIELDS = ('username', 'email', 'phone_number', 'password')
+UNIQUE_FIELDS = ('username', 'email', 'phone_number')
+
+
+# readers yield (row, line, error) so a line that can't be parsed is rejected like an invalid row and
+# every reject keeps the original line for a re-run
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield {field: row.get(field) or None for field in FIELDS}, format_csv_line(reader.fieldnames, row), None
+
+
+def format_csv_line(fieldnames, row):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='').writerow([row.get(name) for name in fieldnames])
+    return buffer.getvalue()
+
+
+def read_jsonl(stream):
+    for number, line in enumerate(stream, 1):
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield dict.fromkeys(FIELDS), line, f'line {number}: invalid json, {e}'
+            continue
+        if not isinstance(row, dict):
+            yield dict.fromkeys(FIELDS), line, f'line {number}: expected a json object'
+            continue
+        yield {field: row.get(field) or None for field in FIELDS}, line, None
+
+
+class RejectWriter:
+    def __init__(self, path, file_format):
+        self.stream = open(path, 'w', newline='', encoding='utf-8')
+        self.file_format = file_format
+        self.writer = None
+        if file_format == 'csv':
+            self.writer = csv.DictWriter(self.stream, fieldnames=FIELDS + ('reason', 'line'))
+            self.writer.writeheader()
+
+    def write(self, row, line, reason):
+        row = dict(row, password=None, reason=reason, line=line)
+        if self.writer:
+            self.writer.writerow(row)
+        else:
+            self.stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.stream.close()
+
+
+class Command(BaseCommand):
+    help = 'Stream users from a csv or jsonl file into the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'jsonl'))
+        parser.add_argument('--reject-file')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        reject_path = options['reject_file'] or f'{path}.rejects.{file_format}'
+        self.processed = self.created = self.rejected = 0
+        self.workers = options['workers']
+        self.rejects = RejectWriter(reject_path, file_format)
+        start = time.monotonic()
+        try:
+            with open(path, newline='', encoding='utf-8') as stream, \
+                    ProcessPoolExecutor(self.workers, initializer=django.setup) as pool:
+                rows = read_csv(stream) if file_format == 'csv' else read_jsonl(stream)
+                while True:
+                    chunk = list(islice(rows, options['chunk_size']))
+                    if not chunk:
+                        break
+                    self.import_chunk(chunk, pool)
+                    elapsed = time.monotonic() - start
+                    self.stdout.write(
+                        f'{self.processed} processed, {self.created} created, {self.rejected} rejected '
+                        f'({self.processed / elapsed:.0f} rows/s)'
+                    )
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+        finally:
+            self.rejects.close()
+        self.stdout.write(self.style.SUCCESS(f'done, rejected rows are in {reject_path}'))
+
+    def reject(self, row, line, reason):
+        self.rejected += 1
+        self.rejects.write(row, line, reason)
+
+    def clean(self, row):
+        for field in FIELDS:
+            if row[field] is not None and not isinstance(row[field], str):
+                raise ValidationError(f'{field} must be a string.')
+        if row['phone_number']:
+            row['phone_number'] = normalize_phone_number(row['phone_number'])
+            check_phone_number(row['phone_number'])
+        if row['email']:
+            row['email'] = BaseUserManager.normalize_email(row['email'].strip())
+            validate_email(row['email'])
+        if row['username'] and len(row['username']) > 32:
+            raise ValidationError('username must less than 32 chars.')
+        return row
+
+    def import_chunk(self, chunk, pool):
+        self.processed += len(chunk)
+        rows, seen = [], {field: set() for field in UNIQUE_FIELDS}
+        for row, line, error in chunk:
+            if error:
+                self.reject(row, line, error)
+                continue
+            try:
+                row = self.clean(row)
+            except ValidationError as e:
+                self.reject(row, line, ' '.join(e.messages))
+                continue
+            duplicate = next((field for field in UNIQUE_FIELDS if row[field] and row[field] in seen[field]), None)
+            if duplicate:
+                self.reject(row, line, f'duplicate {duplicate} in input')
+                continue
+            for field in UNIQUE_FIELDS:
+                if row[field]:
+                    seen[field].add(row[field])
+            rows.append((row, line))
+
+        existing = {
+            field: set(User.objects.filter(**{f'{field}__in': seen[field]}).values_list(field, flat=True))
+            for field in UNIQUE_FIELDS if seen[field]
+        }
+        accepted = []
+        for row, line in rows:
+            conflict = next((field for field in existing if row[field] in existing[field]), None)
+            if conflict:
+                self.reject(row, line, f'{conflict} already exists')
+            else:
+                accepted.append((row, line))
+
+        usernames = iter(reserve_usernames(sum(1 for row, _ in accepted if not row['username'])))
+        for row, _ in accepted:
+            row['username'] = row['username'] or next(usernames)
+        raw = [row['password'] for row, _ in accepted if row['password']]
+        hashes = iter(pool.map(make_password, raw, chunksize=max(1, len(raw) // (self.workers * 4))))
+        users = [
+            User(
+                username=row['username'],
+                email=row['email'],
+                phone_number=row['phone_number'],
+                password=next(hashes) if row['password'] else make_password(None),
+            )
+            for row, _ in accepted
+        ]
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users, batch_size=500)
+            self.created += len(users)
+        except IntegrityError:
+            # someone else inserted a conflicting user meanwhile, fall back to row by row
+            for (row, line), user in zip(accepted, users):
+                try:
+                    with transaction.atomic():
+                        user.save()
+                    self.created += 1
+                except IntegrityError as e:
+                    self.reject(row, line, str(e))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from accounts.pipeline import CHANNELS, PIPELINE_METRICS, queue_wait, provider_seconds, delivery_seconds, \
+    late_deliveries, expired_drops, duplicate_drops
+
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Command(BaseCommand):
+    help = 'Report otp delivery latency percentiles and the share of codes delivered after expiry.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='clear the counters after reporting')
+
+    def handle(self, *args, **options):
+        waits, providers, deliveries, late, dropped, duplicates = (
+            queue_wait.read(), provider_seconds.read(), delivery_seconds.read(), late_deliveries.read(),
+            expired_drops.read(), duplicate_drops.read(),
+        )
+        for channel in CHANNELS:
+            ok, failed = sum(deliveries[channel, 'ok'][0]), sum(deliveries[channel, 'failed'][0])
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{channel}: {ok} delivered, {failed} failed'))
+            self.write_quantiles('queue wait', queue_wait, waits[(channel, )][0])
+            self.write_quantiles('provider', provider_seconds, providers[channel, 'ok'][0])
+            self.write_quantiles('end to end', delivery_seconds, deliveries[channel, 'ok'][0])
+            late_count = late[(channel, )]
+            share = late_count / ok if ok else 0
+            self.stdout.write(f'  delivered after expiry: {late_count} ({share:.2%})')
+            self.stdout.write(f'  dropped as expired: {dropped[(channel, )]}')
+            self.stdout.write(f'  dropped as duplicate: {duplicates[(channel, )]}')
+        if options['reset']:
+            for metric in PIPELINE_METRICS:
+                metric.reset()
+            self.stdout.write(self.style.SUCCESS('counters reset.'))
+
+    def write_quantiles(self, name, histogram, counts):
+        values = []
+        for q in QUANTILES:
+            value = histogram.quantile(q, counts)
+            values.append(f'p{q * 100:g} ' + ('-' if value is None else f'{value * 1000:.0f}ms'))
+        self.stdout.write(f'  {name:>10}: {", ".join(values)}')
@@ -0,0 +1,35 @@
+import logging
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from accounts.outbox import relay_otp_outbox
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Publish otp codes written to the outbox to the celery queues.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.OTP_OUTBOX_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=settings.OTP_OUTBOX_POLL_SECONDS,
+                            help='seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            relayed = relay_otp_outbox(options['batch_size'], drain=True)
+            self.stdout.write(self.style.SUCCESS(f'{relayed} outbox messages relayed.'))
+            return
+        while True:
+            close_old_connections()
+            try:
+                relayed = relay_otp_outbox(options['batch_size'])
+            except Exception:
+                # the broker or the database is away, keep the messages and try again
+                logger.exception('could not relay the otp outbox')
+                relayed = 0
+            if relayed < options['batch_size']:
+                time.sleep(options['interval'])
@@ -1,21 +1,43 @@
-from django.contrib.auth.models import BaseUserManager
 import random
+from datetime import datetime, timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import BaseUserManager
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q
+from django.db.models.functions import Now
+from .ids import allocate_username
+from .phone import normalize_phone_number
 
 
 class UserManager(BaseUserManager):
 
-    def create_user(self, password=None, phone_number=None, email=None, username=None):
-        if not username:
-            username = str(random.randint(10000000000, 9999999999999999))
-        if not password:
-            password = str(random.randint(10000000, 99999999))
-        user = self.model(username=username, phone_number=phone_number)
+    def create_user(self, password=None, phone_number=None, email=None, username=None, hash_password=make_password):
+        generated = not username
+        if generated:
+            username = allocate_username()
+        user = self.model(username=username, phone_number=normalize_phone_number(phone_number))
         if email:
             email = BaseUserManager.normalize_email(email)
             user.email = email
-        user.set_password(password)
-        user.save(using=self._db)
-        return user
+        # otp accounts never log in with a password, so don't spend a hash on one; web views pass the
+        # password service's make_password, management commands hash inline without starting a pool
+        if password:
+            user.password = hash_password(password)
+        else:
+            user.set_unusable_password()
+        if not generated:
+            user.save(using=self._db)
+            return user
+        for attempt in range(3):
+            try:
+                with transaction.atomic(using=self._db):
+                    user.save(using=self._db)
+                return user
+            except IntegrityError:
+                # a duplicate id means two processes shared a node; anything else fails again and is raised
+                if attempt == 2:
+                    raise
+                user.username = allocate_username()
 
     def create_superuser(self, password, email, phone_number, username=None):
         if not email:
@@ -27,3 +49,90 @@ class UserManager(BaseUserManager):
         user.is_superuser = True
         user.save(using=self._db)
         return user
+
+
+class ExpiringManager(models.Manager):
+
+    def delete_expired(self, batch_size=1000):
+        deleted = 0
+        while True:
+            pks = list(self.filter(expire_time__lt=datetime.now()).values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return deleted
+            deleted += self.filter(pk__in=pks).delete()[0]
+
+
+class OtpCodeManager(ExpiringManager):
+    pass
+
+
+class OtpOutboxManager(ExpiringManager):
+
+    def claim(self, owner, batch_size, stale_seconds):
+        # the conditional update is atomic on every backend, so two relays never claim the same row. a published
+        # row is not published again on a timer, its message expires with the code; only a claim the relay left
+        # before publishing or a worker left while delivering is taken over once it is stale_seconds old
+        stale = Now() - timedelta(seconds=stale_seconds)
+        pending = self.filter(
+            Q(claimed_at__isnull=True) & (Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=Now()))
+            | Q(published_at__isnull=True, claimed_at__lt=stale)
+            | Q(delivering=True, claimed_at__lt=stale)
+        )
+        pks = list(pending.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        pending.filter(pk__in=pks).update(claimed_at=Now(), claimed_by=owner, published_at=None, delivering=False)
+        return list(self.filter(pk__in=pks, claimed_by=owner).order_by('pk'))
+
+    def mark_published(self, pks, owner):
+        return self.filter(pk__in=pks, claimed_by=owner).update(published_at=Now())
+
+    def release(self, pks, owner):
+        return self.filter(pk__in=pks, claimed_by=owner, delivering=False).update(claimed_at=None, claimed_by=None)
+
+    def start_delivery(self, pk, claim):
+        # the message carries the claim it was published under, a late copy from an older claim is dropped
+        return bool(self.filter(pk=pk, claimed_by=claim, delivering=False).update(delivering=True, claimed_at=Now()))
+
+    def finish_delivery(self, pk, claim, ok, retry, max_attempts, backoff_seconds):
+        # a failed send goes back to the relay after an exponential backoff until it runs out of attempts; a send
+        # that may have reached the provider is never repeated
+        if ok or not retry:
+            self.filter(pk=pk).delete()
+            return
+        attempts = self.filter(pk=pk, claimed_by=claim).values_list('attempts', flat=True).first()
+        if attempts is None:
+            return
+        if attempts + 1 >= max_attempts:
+            self.filter(pk=pk).delete()
+            return
+        self.filter(pk=pk, claimed_by=claim).update(
+            attempts=attempts + 1, next_attempt_at=Now() + timedelta(seconds=backoff_seconds * 2 ** attempts),
+            delivering=False, claimed_at=None, claimed_by=None, published_at=None,
+        )
+
+
+class RevokedTokenManager(ExpiringManager):
+    pass
+
+
+class SnowflakeNodeManager(models.Manager):
+
+    def lease(self, owner, nodes, seconds):
+        # expiry is computed by the database so the hosts' clocks don't have to agree
+        start = random.randrange(nodes)
+        for offset in range(nodes):
+            node_id = (start + offset) % nodes
+            try:
+                with transaction.atomic(using=self.db):
+                    self.create(node_id=node_id, owner=owner, expire_time=Now() + timedelta(seconds=seconds))
+                return node_id
+            except IntegrityError:
+                pass
+            taken = self.filter(node_id=node_id, expire_time__lt=Now()).update(
+                owner=owner, expire_time=Now() + timedelta(seconds=seconds)
+            )
+            if taken:
+                return node_id
+        raise RuntimeError('every snowflake node id is leased.')
+
+    def renew(self, node_id, owner, seconds):
+        return bool(self.filter(node_id=node_id, owner=owner).update(expire_time=Now() + timedelta(seconds=seconds)))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.utils.deprecation import MiddlewareMixin
+
+
+IDENTIFIER_AUTH_BACKEND = 'accounts.authenticate.IdentifierAuthBackend'
+# IdentifierAuthBackend replaced these; django logs out a session whose backend is no longer configured
+LEGACY_AUTH_BACKENDS = {
+    'django.contrib.auth.backends.ModelBackend',
+    'accounts.authenticate.UsernameAuthBackend',
+    'accounts.authenticate.PhoneNumberAuthBackend',
+}
+
+
+class LegacyAuthBackendMiddleware(MiddlewareMixin):
+    # can be removed once sessions older than the backend switch have expired (SESSION_COOKIE_AGE)
+    def process_request(self, request):
+        if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            return
+        if request.session.get(BACKEND_SESSION_KEY) in LEGACY_AUTH_BACKENDS:
+            request.session[BACKEND_SESSION_KEY] = IDENTIFIER_AUTH_BACKEND
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_otpcode_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('jti', 'token'), ('user', 'all tokens of user')], max_length=4, verbose_name='kind')),
+                ('value', models.CharField(max_length=64, verbose_name='value')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('expire_time', models.DateTimeField(verbose_name='expire time')),
+            ],
+            options={
+                'verbose_name': 'Revoked token',
+                'verbose_name_plural': 'Revoked tokens',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='revokedtoken',
+            index=models.Index(fields=['kind', 'value'], name='revokedtoken_kind_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='revokedtoken',
+            index=models.Index(fields=['expire_time'], name='revokedtoken_expire_time_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations
+
+
+# a frozen copy of accounts.phone as of this migration, so later changes there can't alter it
+TRANSLATION = str.maketrans('۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩', '0123456789' * 2, ' \t\u00a0\u200c\u200e\u200f-.()')
+
+
+def normalize_phone_number(value):
+    value = value.translate(TRANSLATION)
+    for prefix in ('+98', '0098'):
+        if value.startswith(prefix):
+            return '0' + value[len(prefix):]
+    if len(value) == 12 and value.startswith('98'):
+        return '0' + value[2:]
+    if len(value) == 10 and value.startswith('9'):
+        return '0' + value
+    return value
+
+
+def is_phone_number(value):
+    return len(value) == 11 and value.isascii() and value.isdigit() and value.startswith('09')
+
+
+def canonicalize_phone_numbers(apps, schema_editor):
+    User = apps.get_model('accounts', 'User')
+    users = User.objects.using(schema_editor.connection.alias)
+    changes = []
+    for pk, phone_number in users.exclude(phone_number=None).values_list('pk', 'phone_number').iterator(chunk_size=2000):
+        canonical = normalize_phone_number(phone_number)
+        if canonical != phone_number and is_phone_number(canonical):
+            changes.append((pk, canonical))
+    for start in range(0, len(changes), 1000):
+        batch = changes[start:start + 1000]
+        taken = set(users.filter(phone_number__in=[canonical for _, canonical in batch]).values_list('phone_number', flat=True))
+        updates = []
+        for pk, canonical in batch:
+            # another account already owns the canonical number, leave this one for a manual merge
+            if canonical in taken:
+                continue
+            taken.add(canonical)
+            updates.append(User(pk=pk, phone_number=canonical))
+        users.bulk_update(updates, ['phone_number'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_phone_numbers, migrations.RunPython.noop),
+    ]
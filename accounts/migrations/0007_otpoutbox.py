@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_canonical_phone_numbers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OtpOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone_number', models.CharField(blank=True, max_length=11, null=True, verbose_name='phone number')),
+                ('email', models.CharField(blank=True, max_length=120, null=True, verbose_name='email')),
+                ('code', models.CharField(max_length=4, verbose_name='code')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('expire_time', models.DateTimeField(verbose_name='expire time')),
+            ],
+            options={
+                'verbose_name': 'Otp outbox message',
+                'verbose_name_plural': 'Otp outbox',
+            },
+        ),
+    ]
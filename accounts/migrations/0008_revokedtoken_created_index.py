@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_otpoutbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='revokedtoken',
+            index=models.Index(fields=['created'], name='revokedtoken_created_idx'),
+        ),
+    ]
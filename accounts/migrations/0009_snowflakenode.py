@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_revokedtoken_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnowflakeNode',
+            fields=[
+                ('node_id', models.PositiveSmallIntegerField(primary_key=True, serialize=False, verbose_name='node id')),
+                ('owner', models.CharField(max_length=100, verbose_name='owner')),
+                ('expire_time', models.DateTimeField(verbose_name='expire time')),
+            ],
+            options={
+                'verbose_name': 'Snowflake node',
+                'verbose_name_plural': 'Snowflake nodes',
+            },
+        ),
+    ]
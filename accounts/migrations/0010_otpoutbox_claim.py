@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_snowflakenode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='otpoutbox',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='otpoutbox',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='otpoutbox',
+            name='delivering',
+            field=models.BooleanField(default=False),
+        ),
+    ]
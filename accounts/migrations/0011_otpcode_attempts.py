@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_otpoutbox_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='otpcode',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='otpcode',
+            name='email',
+            field=models.CharField(blank=True, max_length=120, null=True, verbose_name='email'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_otpcode_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='otpoutbox',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='otpoutbox',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='otpoutbox',
+            name='published_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
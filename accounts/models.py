@@ -1,7 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.utils.translation import gettext_lazy as _
-from .managers import UserManager
+from .managers import UserManager, OtpCodeManager, OtpOutboxManager, RevokedTokenManager, SnowflakeNodeManager
 
 
 class User(AbstractBaseUser, PermissionsMixin):
@@ -40,18 +40,93 @@ class EffortAuthenticate(models.Model):
         verbose_name_plural = _('Efforts authenticate')
 
     def __str__(self):
-        return self.user
+        return str(self.user)
 
 
 class OtpCode(models.Model):
     phone_number = models.CharField(max_length=11, null=True, blank=True, verbose_name=_('phone number'))
-    email = models.CharField(max_length=11, null=True, blank=True, verbose_name=_('email'))
+    email = models.CharField(max_length=120, null=True, blank=True, verbose_name=_('email'))
     code = models.CharField(max_length=4, verbose_name=_('code'))
     expire_time = models.DateTimeField(verbose_name=_('expire time'))
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    objects = OtpCodeManager()
 
     class Meta:
         verbose_name = _('Otp code')
         verbose_name_plural = _('Otp codes')
+        indexes = [
+            models.Index(fields=('code', 'expire_time'), name='otpcode_code_expire_idx'),
+            models.Index(fields=('phone_number', ), name='otpcode_phone_number_idx'),
+            models.Index(fields=('email', ), name='otpcode_email_idx'),
+            models.Index(fields=('expire_time', ), name='otpcode_expire_time_idx'),
+        ]
 
     def __str__(self):
         return self.code
+
+
+class RevokedToken(models.Model):
+    JTI = 'jti'
+    USER = 'user'
+    KIND_CHOICES = (
+        (JTI, _('token')),
+        (USER, _('all tokens of user')),
+    )
+
+    kind = models.CharField(max_length=4, choices=KIND_CHOICES, verbose_name=_('kind'))
+    value = models.CharField(max_length=64, verbose_name=_('value'))
+    created = models.DateTimeField(auto_now_add=True)
+    expire_time = models.DateTimeField(verbose_name=_('expire time'))
+
+    objects = RevokedTokenManager()
+
+    class Meta:
+        verbose_name = _('Revoked token')
+        verbose_name_plural = _('Revoked tokens')
+        indexes = [
+            models.Index(fields=('kind', 'value'), name='revokedtoken_kind_value_idx'),
+            models.Index(fields=('expire_time', ), name='revokedtoken_expire_time_idx'),
+            models.Index(fields=('created', ), name='revokedtoken_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind}:{self.value}'
+
+
+class OtpOutbox(models.Model):
+    phone_number = models.CharField(max_length=11, null=True, blank=True, verbose_name=_('phone number'))
+    email = models.CharField(max_length=120, null=True, blank=True, verbose_name=_('email'))
+    code = models.CharField(max_length=4, verbose_name=_('code'))
+    created = models.DateTimeField(auto_now_add=True)
+    expire_time = models.DateTimeField(verbose_name=_('expire time'))
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    claimed_by = models.CharField(max_length=32, null=True, blank=True)
+    delivering = models.BooleanField(default=False)
+    published_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+
+    objects = OtpOutboxManager()
+
+    class Meta:
+        verbose_name = _('Otp outbox message')
+        verbose_name_plural = _('Otp outbox')
+
+    def __str__(self):
+        return self.phone_number or self.email
+
+
+class SnowflakeNode(models.Model):
+    node_id = models.PositiveSmallIntegerField(primary_key=True, verbose_name=_('node id'))
+    owner = models.CharField(max_length=100, verbose_name=_('owner'))
+    expire_time = models.DateTimeField(verbose_name=_('expire time'))
+
+    objects = SnowflakeNodeManager()
+
+    class Meta:
+        verbose_name = _('Snowflake node')
+        verbose_name_plural = _('Snowflake nodes')
+
+    def __str__(self):
+        return f'{self.node_id}:{self.owner}'
@@ -0,0 +1,148 @@
+import random
+import time
+from asgiref.sync import sync_to_async
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.module_loading import import_string
+from core.instrumentation import record_cache
+from .models import OtpCode, OtpOutbox
+from .tasks import send_sms_code_task, send_mail_code_task
+from .throttling import get_otp_rate_limiter
+
+
+OTP_SESSION_KEY = '_otp_destination'
+
+Otp = namedtuple('Otp', ('code', 'phone_number', 'email', 'expire_time'))
+
+
+class BaseOtpStore:
+    def add(self, code, phone_number=None, email=None):
+        raise NotImplementedError
+
+    def pop(self, code, destination=None):
+        raise NotImplementedError
+
+    @staticmethod
+    def get_expire_time():
+        return datetime.now() + timedelta(seconds=settings.OTP_EXPIRE_SECONDS)
+
+
+class ModelOtpStore(BaseOtpStore):
+    def add(self, code, phone_number=None, email=None):
+        otp_code = OtpCode.objects.create(
+            phone_number=phone_number, email=email, code=code, expire_time=self.get_expire_time()
+        )
+        return Otp(otp_code.code, otp_code.phone_number, otp_code.email, otp_code.expire_time)
+
+    def pop(self, code, destination=None):
+        # a wrong guess counts against the destination's latest code, which is burnt after OTP_MAX_ATTEMPTS
+        if not destination:
+            return None
+        otp_codes = OtpCode.objects.filter(Q(phone_number=destination) | Q(email=destination))
+        otp_code = otp_codes.order_by('-expire_time').first()
+        if otp_code is None:
+            return None
+        if otp_code.code != code:
+            OtpCode.objects.filter(pk=otp_code.pk).update(attempts=F('attempts') + 1)
+            OtpCode.objects.filter(pk=otp_code.pk, attempts__gte=settings.OTP_MAX_ATTEMPTS).delete()
+            return None
+        # only the request that actually deletes the row may use the code
+        deleted, _ = OtpCode.objects.filter(pk=otp_code.pk, attempts__lt=settings.OTP_MAX_ATTEMPTS).delete()
+        if not deleted:
+            return None
+        return Otp(otp_code.code, otp_code.phone_number, otp_code.email, otp_code.expire_time)
+
+
+class CacheOtpStore(BaseOtpStore):
+    key_prefix = 'otp'
+
+    def __init__(self, alias=None):
+        self.cache = caches[alias or settings.OTP_CACHE_ALIAS]
+        # a code issued by one process has to verify in every other one
+        if isinstance(self.cache, LocMemCache):
+            raise ImproperlyConfigured('CacheOtpStore needs a cache shared between processes, not LocMemCache.')
+
+    def make_key(self, destination):
+        return f'{self.key_prefix}:{destination}'
+
+    def add(self, code, phone_number=None, email=None):
+        otp = Otp(code, phone_number, email, self.get_expire_time())
+        key = self.make_key(phone_number or email)
+        self.cache.set_many({key: otp, f'{key}:attempts': 0}, settings.OTP_EXPIRE_SECONDS)
+        return otp
+
+    def pop(self, code, destination=None):
+        if not destination:
+            return None
+        key = self.make_key(destination)
+        otp = self.cache.get(key)
+        record_cache('otp', 'miss' if otp is None else 'hit')
+        if otp is None:
+            return None
+        if otp.code != code:
+            try:
+                attempts = self.cache.incr(f'{key}:attempts')
+            except ValueError:
+                attempts = settings.OTP_MAX_ATTEMPTS
+            if attempts >= settings.OTP_MAX_ATTEMPTS:
+                self.cache.delete(key)
+            return None
+        # cache.delete() reports whether the key existed, so concurrent verifies can't both win
+        if not self.cache.delete(key):
+            return None
+        return otp
+
+
+@lru_cache(maxsize=None)
+def get_otp_store():
+    return import_string(settings.OTP_STORE)()
+
+
+def issue_otp_code(request, phone_number=None, email=None):
+    get_otp_rate_limiter().check_destination(phone_number or email)
+    code = str(random.randint(1000, 9999))
+    # in outbox mode the delivery message commits with the code (in one transaction with ModelOtpStore)
+    # and the relay publishes it, so the request never waits on the broker
+    with transaction.atomic():
+        otp = get_otp_store().add(code, phone_number=phone_number, email=email)
+        if settings.OTP_DELIVERY_MODE == 'outbox':
+            OtpOutbox.objects.create(
+                phone_number=otp.phone_number, email=otp.email, code=otp.code, expire_time=otp.expire_time
+            )
+    request.session[OTP_SESSION_KEY] = phone_number or email
+    return otp
+
+
+def publish_otp_code(otp, enqueued_at=None, delivery_id=None, delivery_claim=None):
+    # the stamps let the worker measure queue wait and drop codes that expired while queued;
+    # expires makes the broker side discard them too
+    now, expires_at = time.time(), otp.expire_time.timestamp()
+    stamps = {'enqueued_at': enqueued_at or now, 'expires_at': expires_at}
+    if delivery_id is not None:
+        stamps.update(delivery_id=delivery_id, delivery_claim=delivery_claim)
+    if otp.phone_number:
+        send_sms_code_task.apply_async((otp.phone_number, otp.code), stamps, expires=max(0.0, expires_at - now))
+    else:
+        send_mail_code_task.apply_async((otp.email, otp.code), stamps, expires=max(0.0, expires_at - now))
+
+
+def send_otp_code(request, phone_number=None, email=None):
+    otp = issue_otp_code(request, phone_number=phone_number, email=email)
+    if settings.OTP_DELIVERY_MODE != 'outbox':
+        publish_otp_code(otp)
+    return otp.code
+
+
+async def asend_otp_code(request, phone_number=None, email=None):
+    otp = await sync_to_async(issue_otp_code)(request, phone_number=phone_number, email=email)
+    if settings.OTP_DELIVERY_MODE != 'outbox':
+        # publishing only waits on the broker, so keep it off the thread that serves the ORM
+        await sync_to_async(publish_otp_code, thread_sensitive=False)(otp)
+    return otp.code
@@ -0,0 +1,36 @@
+import uuid
+from datetime import datetime
+from django.conf import settings
+from .models import OtpOutbox
+from .otp import Otp, publish_otp_code
+from .pipeline import expired_drops
+
+
+def relay_otp_outbox(batch_size=None, drain=False):
+    # rows are claimed in the database and stay there until a worker sends them; the message carries the claim,
+    # so a worker drops a copy published under a claim that was taken over since
+    batch_size = batch_size or settings.OTP_OUTBOX_BATCH_SIZE
+    relayed = 0
+    while True:
+        now, owner = datetime.now(), uuid.uuid4().hex
+        messages = OtpOutbox.objects.claim(owner, batch_size, settings.OTP_OUTBOX_CLAIM_SECONDS)
+        published, expired = [], []
+        try:
+            for message in messages:
+                if message.expire_time <= now:
+                    expired_drops.inc(channel='sms' if message.phone_number else 'email')
+                    expired.append(message.pk)
+                    continue
+                otp = Otp(message.code, message.phone_number, message.email, message.expire_time)
+                publish_otp_code(
+                    otp, enqueued_at=message.created.timestamp(), delivery_id=message.pk, delivery_claim=owner
+                )
+                published.append(message.pk)
+        finally:
+            OtpOutbox.objects.filter(pk__in=expired).delete()
+            OtpOutbox.objects.mark_published(published, owner)
+            handled = set(published) | set(expired)
+            OtpOutbox.objects.release([message.pk for message in messages if message.pk not in handled], owner)
+        relayed += len(messages)
+        if not drain or len(messages) < batch_size:
+            return relayed
@@ -0,0 +1,110 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import django
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, identify_hasher, is_password_usable, make_password
+
+
+class PasswordServiceBusy(Exception):
+    pass
+
+
+def password_service_was_busy(request):
+    # set by the auth backend, which turns a busy pool into a failed authenticate()
+    return getattr(request, 'password_service_busy', False)
+
+
+def verify_password(password, encoded):
+    # django's check_password, except that the upgraded hash is returned instead of saved
+    if password is None or not is_password_usable(encoded):
+        return False, None
+    preferred = get_hasher()
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False, None
+    hasher_changed = hasher.algorithm != preferred.algorithm
+    must_update = hasher_changed or preferred.must_update(encoded)
+    is_correct = hasher.verify(password, encoded)
+    if not is_correct and not hasher_changed and must_update:
+        hasher.harden_runtime(password, encoded)
+    if is_correct and must_update:
+        return True, make_password(password)
+    return is_correct, None
+
+
+class PasswordService:
+    def __init__(self, workers=None, max_pending=64):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._pending = None
+
+    def _ensure_started(self):
+        # a forked web worker must not share its parent's pool
+        if self._executor is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = self._new_executor()
+                self._pending = threading.BoundedSemaphore(self.max_pending)
+
+    def _new_executor(self):
+        # forking a threaded web or celery process can copy locks held by other threads, forkserver
+        # children start from a clean single threaded server instead
+        return ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context('forkserver'), initializer=django.setup
+        )
+
+    def submit(self, fn, *args):
+        if self.workers == 0:
+            future = Future()
+            future.set_result(fn(*args))
+            return future
+        self._ensure_started()
+        if not self._pending.acquire(blocking=False):
+            raise PasswordServiceBusy()
+        try:
+            try:
+                future = self._executor.submit(fn, *args)
+            except BrokenProcessPool:
+                # a killed child breaks the whole pool, start a fresh one
+                with self._lock:
+                    self._executor = self._new_executor()
+                future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown()
+            self._executor = None
+
+    def check_password(self, password, encoded):
+        return self.submit(verify_password, password, encoded).result()
+
+    def make_password(self, password):
+        return self.submit(make_password, password).result()
+
+    async def acheck_password(self, password, encoded):
+        return await asyncio.wrap_future(self.submit(verify_password, password, encoded))
+
+    async def amake_password(self, password):
+        return await asyncio.wrap_future(self.submit(make_password, password))
+
+
+@lru_cache(maxsize=None)
+def get_password_service():
+    return PasswordService(workers=settings.PASSWORD_POOL_WORKERS, max_pending=settings.PASSWORD_POOL_MAX_PENDING)
@@ -0,0 +1,25 @@
+PERSIAN_DIGITS = '۰۱۲۳۴۵۶۷۸۹'
+ARABIC_DIGITS = '٠١٢٣٤٥٦٧٨٩'
+SEPARATORS = ' \t\u00a0\u200c\u200e\u200f-.()'
+
+# one pass maps both digit sets to ascii and drops the separators people type between groups
+TRANSLATION = str.maketrans(PERSIAN_DIGITS + ARABIC_DIGITS, '0123456789' * 2, SEPARATORS)
+COUNTRY_PREFIXES = ('+98', '0098')
+
+
+def normalize_phone_number(value):
+    if not value:
+        return value
+    value = value.translate(TRANSLATION)
+    for prefix in COUNTRY_PREFIXES:
+        if value.startswith(prefix):
+            return '0' + value[len(prefix):]
+    if len(value) == 12 and value.startswith('98'):
+        return '0' + value[2:]
+    if len(value) == 10 and value.startswith('9'):
+        return '0' + value
+    return value
+
+
+def is_phone_number(value):
+    return len(value) == 11 and value.isascii() and value.isdigit() and value.startswith('09')
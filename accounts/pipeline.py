@@ -0,0 +1,85 @@
+import time
+from django.conf import settings
+from core.metrics import registry, SharedCounter, SharedHistogram
+from .models import OtpOutbox
+
+
+OTP_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+CHANNELS = ('sms', 'email')
+OUTCOMES = ('ok', 'failed')
+BY_CHANNEL = [(channel, ) for channel in CHANNELS]
+BY_OUTCOME = [(channel, outcome) for channel in CHANNELS for outcome in OUTCOMES]
+
+queue_wait = registry.register(SharedHistogram(
+    'otp_queue_wait_seconds', 'Time an otp code waited in the broker before a worker picked it up.',
+    ('channel', ), BY_CHANNEL, OTP_BUCKETS, alias=settings.OTP_METRICS_CACHE_ALIAS,
+    flush_interval=settings.OTP_METRICS_FLUSH_SECONDS,
+))
+provider_seconds = registry.register(SharedHistogram(
+    'otp_provider_seconds', 'Time the sms or mail provider took to accept an otp code.',
+    ('channel', 'outcome'), BY_OUTCOME, OTP_BUCKETS, alias=settings.OTP_METRICS_CACHE_ALIAS,
+    flush_interval=settings.OTP_METRICS_FLUSH_SECONDS,
+))
+delivery_seconds = registry.register(SharedHistogram(
+    'otp_delivery_seconds', 'Time from the view publishing an otp code to the provider accepting it.',
+    ('channel', 'outcome'), BY_OUTCOME, OTP_BUCKETS, alias=settings.OTP_METRICS_CACHE_ALIAS,
+    flush_interval=settings.OTP_METRICS_FLUSH_SECONDS,
+))
+late_deliveries = registry.register(SharedCounter(
+    'otp_late_deliveries', 'Otp codes handed to the provider after they had expired.',
+    ('channel', ), BY_CHANNEL, alias=settings.OTP_METRICS_CACHE_ALIAS,
+    flush_interval=settings.OTP_METRICS_FLUSH_SECONDS,
+))
+expired_drops = registry.register(SharedCounter(
+    'otp_expired_drops', 'Otp codes a worker dropped because they expired while queued.',
+    ('channel', ), BY_CHANNEL, alias=settings.OTP_METRICS_CACHE_ALIAS,
+    flush_interval=settings.OTP_METRICS_FLUSH_SECONDS,
+))
+duplicate_drops = registry.register(SharedCounter(
+    'otp_duplicate_drops', 'Outbox messages a worker dropped because another delivery of them was already sent.',
+    ('channel', ), BY_CHANNEL, alias=settings.OTP_METRICS_CACHE_ALIAS,
+    flush_interval=settings.OTP_METRICS_FLUSH_SECONDS,
+))
+PIPELINE_METRICS = (queue_wait, provider_seconds, delivery_seconds, late_deliveries, expired_drops, duplicate_drops)
+
+
+class DeliveryTimer:
+    def __init__(self, channel, enqueued_at=None, expires_at=None):
+        self.channel = channel
+        self.enqueued_at = enqueued_at
+        self.expires_at = expires_at
+        self.delivery_id = self.delivery_claim = None
+        if enqueued_at is not None:
+            queue_wait.observe(max(0.0, time.time() - enqueued_at), channel=channel)
+        self.started = time.perf_counter()
+
+    def expired(self):
+        if self.expires_at is None or time.time() < self.expires_at:
+            return False
+        expired_drops.inc(channel=self.channel)
+        return True
+
+    def claim(self, delivery_id, delivery_claim=None):
+        # the worker that marks the outbox row as delivering under the claim it was published with sends it, any
+        # other copy is dropped; finish deletes the row or hands it back for a retry
+        if delivery_id is None:
+            return True
+        if OtpOutbox.objects.start_delivery(delivery_id, delivery_claim):
+            self.delivery_id, self.delivery_claim = delivery_id, delivery_claim
+            return True
+        duplicate_drops.inc(channel=self.channel)
+        return False
+
+    def finish(self, ok, retry=True):
+        outcome = 'ok' if ok else 'failed'
+        provider_seconds.observe(time.perf_counter() - self.started, channel=self.channel, outcome=outcome)
+        now = time.time()
+        if self.enqueued_at is not None:
+            delivery_seconds.observe(max(0.0, now - self.enqueued_at), channel=self.channel, outcome=outcome)
+        if ok and self.expires_at is not None and now > self.expires_at:
+            late_deliveries.inc(channel=self.channel)
+        if self.delivery_id is not None:
+            OtpOutbox.objects.finish_delivery(
+                self.delivery_id, self.delivery_claim, ok, retry,
+                settings.OTP_OUTBOX_MAX_ATTEMPTS, settings.OTP_OUTBOX_RETRY_SECONDS,
+            )
@@ -0,0 +1,113 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from django.conf import settings
+from rest_framework_simplejwt.settings import api_settings
+from .models import RevokedToken
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.size / 8))
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big')
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    def __init__(self, capacity=100000, error_rate=0.001, sync_seconds=10, overlap_seconds=60):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_seconds = sync_seconds
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self.filter = BloomFilter(capacity, error_rate)
+        self.synced_until = None
+        self.recent = {}
+        self.next_sync = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_item(kind, value):
+        return f'{kind}:{value}'
+
+    def _add(self, pk, kind, value, created):
+        if pk not in self.recent:
+            self.filter.add(self.make_item(kind, value))
+            self.recent[pk] = created
+
+    def sync(self, force=False):
+        if not force and time.monotonic() < self.next_sync:
+            return
+        with self._lock:
+            if self.filter.count > self.capacity:
+                # swept rows can't be removed from a bloom filter, so start over from the live ones
+                self.capacity = max(self.capacity, self.filter.count * 2)
+                self.filter = BloomFilter(self.capacity, self.error_rate)
+                self.synced_until, self.recent = None, {}
+            # rows don't commit in id or created order, so every sync reads back over the last
+            # overlap_seconds again and skips the rows it has already added
+            rows = RevokedToken.objects.filter(expire_time__gte=datetime.now())
+            if self.synced_until is not None:
+                rows = rows.filter(created__gte=self.synced_until - self.overlap)
+            for pk, kind, value, created in rows.values_list('id', 'kind', 'value', 'created').iterator():
+                self._add(pk, kind, value, created)
+                if self.synced_until is None or created > self.synced_until:
+                    self.synced_until = created
+            if self.synced_until is not None:
+                self.recent = {
+                    pk: created for pk, created in self.recent.items() if created >= self.synced_until - self.overlap
+                }
+            self.next_sync = time.monotonic() + self.sync_seconds
+
+    def _revoke(self, kind, value, expire_time):
+        revoked = RevokedToken.objects.create(kind=kind, value=value, expire_time=expire_time)
+        with self._lock:
+            self._add(revoked.pk, kind, value, revoked.created)
+
+    def revoke_token(self, token):
+        self._revoke(RevokedToken.JTI, token[api_settings.JTI_CLAIM], datetime.fromtimestamp(token['exp']))
+
+    def revoke_user(self, user_id):
+        # every refresh token issued before now dies with this row
+        self._revoke(RevokedToken.USER, str(user_id), datetime.now() + api_settings.REFRESH_TOKEN_LIFETIME)
+
+    def is_revoked(self, token):
+        self.sync()
+        jti, user_id = token[api_settings.JTI_CLAIM], str(token[api_settings.USER_ID_CLAIM])
+        if self.make_item(RevokedToken.JTI, jti) in self.filter:
+            if RevokedToken.objects.filter(kind=RevokedToken.JTI, value=jti).exists():
+                return True
+        if self.make_item(RevokedToken.USER, user_id) in self.filter:
+            revoked = RevokedToken.objects.filter(kind=RevokedToken.USER, value=user_id).order_by('-created')
+            revoked_at = revoked.values_list('created', flat=True).first()
+            # iat has whole seconds only, a token from the second of the revocation counts as revoked
+            if revoked_at is not None and token['iat'] <= revoked_at.timestamp():
+                return True
+        return False
+
+
+@lru_cache(maxsize=None)
+def get_revocation_list():
+    return RevocationList(
+        capacity=settings.JWT_REVOCATION_CAPACITY,
+        error_rate=settings.JWT_REVOCATION_ERROR_RATE,
+        sync_seconds=settings.JWT_REVOCATION_SYNC_SECONDS,
+        overlap_seconds=settings.JWT_REVOCATION_SYNC_OVERLAP_SECONDS,
+    )
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .identity import EMAIL, PHONE_NUMBER, USERNAME, normalize
+from .phone import normalize_phone_number
+
+
+def search_lookup(term):
+    # one indexed lookup chosen by the shape of the term instead of icontains on every column;
+    # startswith on a unique CharField is served by its btree (varchar_pattern_ops on postgres)
+    term = term.strip()
+    if '@' in term:
+        return {f'{EMAIL}__startswith': normalize(term, EMAIL)}
+    digits = normalize_phone_number(term)
+    if digits.startswith('09') and digits.isascii() and digits.isdigit():
+        if len(digits) == 11:
+            return {PHONE_NUMBER: digits}
+        return {f'{PHONE_NUMBER}__startswith': digits}
+    return {f'{USERNAME}__startswith': term}
+
+
+def search_users(queryset, term):
+    if not term.strip():
+        return queryset
+    return queryset.filter(**search_lookup(term))
+
+
+def estimate_table_rows(model, using='default'):
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+                [table],
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            # the planner statistics are good enough for the page links of an unfiltered list
+            estimate = estimate_table_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate >= settings.ADMIN_SEARCH_COUNT_LIMIT:
+                return estimate
+        # filtered lists are counted up to a cap so a broad prefix never turns into a full count
+        return queryset.order_by()[:settings.ADMIN_SEARCH_COUNT_LIMIT].count()
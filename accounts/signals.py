@@ -0,0 +1,23 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .cache import get_user_cache, get_token_cache
+from .models import User
+from .revocation import get_revocation_list
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    get_user_cache().delete(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    get_token_cache().delete(instance.key)
+
+
+@receiver(post_save, sender=User)
+def revoke_tokens_on_password_change(sender, instance, created, **kwargs):
+    # set_password() leaves the raw password on the instance until save() finishes
+    if not created and instance._password is not None:
+        get_revocation_list().revoke_user(instance.pk)
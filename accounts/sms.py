@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import itertools
+import threading
+import requests
+from collections import namedtuple
+from functools import lru_cache
+from django.conf import settings
+from django.utils.module_loading import import_string
+from kavenegar import KavenegarAPI, APIException, HTTPException
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from .batching import MicroBatcher
+
+
+# maybe_sent marks a failure after the request reached the provider (a read timeout, a garbled response), the
+# sms may have gone out and must not be sent again
+SmsResult = namedtuple('SmsResult', ('receptor', 'ok', 'message_id', 'error', 'maybe_sent'), defaults=(False, ))
+
+
+def is_connect_failure(error):
+    # only a request that never reached the provider is safe to retry; a connection aborted after the
+    # body was written may already have sent the sms
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError) or not error.args:
+        return False
+    return isinstance(getattr(error.args[0], 'reason', None), NewConnectionError)
+
+
+class PooledKavenegarAPI(KavenegarAPI):
+    def __init__(self, apikey, pool_size=10, timeout=(3, 10), retries=2, backoff=0.5):
+        super().__init__(apikey)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._session = None
+        self._pid = None
+
+    @property
+    def session(self):
+        # sockets must not be shared with a forked worker process
+        if self._session is None or self._pid != os.getpid():
+            session = requests.Session()
+            session.headers.update(self.headers)
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+            self._session, self._pid = session, os.getpid()
+        return self._session
+
+    def _request(self, action, method, params=None):
+        url = f'https://{self.host}/{self.version}/{self.apikey}/{action}/{method}.json'
+        for attempt in range(self.retries + 1):
+            try:
+                return self._post(url, params or {})
+            except HTTPException as e:
+                if attempt == self.retries or not is_connect_failure(e.__cause__):
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def _post(self, url, params):
+        try:
+            content = self.session.post(url, data=params, timeout=self.timeout).content
+            response = json.loads(content.decode('utf-8'))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise HTTPException(e) from e
+        if response['return']['status'] != 200:
+            raise APIException(f"APIException[{response['return']['status']}] {response['return']['message']}")
+        return response['entries']
+
+
+class BaseSmsProvider:
+    def send(self, receptor, message):
+        raise NotImplementedError
+
+    def send_bulk(self, messages):
+        return [self.send(receptor, message) for receptor, message in messages]
+
+
+class KavenegarSmsProvider(BaseSmsProvider):
+    def __init__(self, api_key=None, sender=None):
+        self.api = PooledKavenegarAPI(
+            api_key or settings.KAVE_API_KEY,
+            pool_size=settings.SMS_HTTP_POOL_SIZE,
+            timeout=(settings.SMS_HTTP_CONNECT_TIMEOUT, settings.SMS_HTTP_READ_TIMEOUT),
+            retries=settings.SMS_HTTP_RETRIES,
+            backoff=settings.SMS_HTTP_BACKOFF,
+        )
+        self.sender = sender or settings.KAVE_SENDER
+
+    def send(self, receptor, message):
+        params = {
+            'sender': self.sender,
+            'receptor': receptor,
+            'message': message,
+        }
+        try:
+            entries = self.api.sms_send(params)
+        except APIException as e:
+            return SmsResult(receptor, False, None, str(e))
+        except HTTPException as e:
+            return SmsResult(receptor, False, None, str(e), not is_connect_failure(e.__cause__))
+        return SmsResult(receptor, True, entries[0].get('messageid'), None)
+
+    def send_bulk(self, messages):
+        if len(messages) == 1:
+            return [self.send(*messages[0])]
+        receptors = [receptor for receptor, _ in messages]
+        params = {
+            'sender': json.dumps([self.sender] * len(messages)),
+            'receptor': json.dumps(receptors),
+            'message': json.dumps([message for _, message in messages]),
+        }
+        try:
+            entries = self.api.sms_sendarray(params)
+        except APIException as e:
+            return [SmsResult(receptor, False, None, str(e)) for receptor in receptors]
+        except HTTPException as e:
+            maybe_sent = not is_connect_failure(e.__cause__)
+            return [SmsResult(receptor, False, None, str(e), maybe_sent) for receptor in receptors]
+        return [
+            SmsResult(receptor, True, entry.get('messageid'), None) for receptor, entry in zip(receptors, entries)
+        ]
+
+
+class StubSmsProvider(BaseSmsProvider):
+    def __init__(self, latency=None):
+        self.latency = settings.SMS_STUB_LATENCY_MS / 1000 if latency is None else latency
+        self.requests = 0
+        self.sent = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _request(self, count):
+        time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            self.sent += count
+            return [next(self._ids) for _ in range(count)]
+
+    def send(self, receptor, message):
+        message_id, = self._request(1)
+        return SmsResult(receptor, True, message_id, None)
+
+    def send_bulk(self, messages):
+        ids = self._request(len(messages))
+        return [SmsResult(receptor, True, message_id, None) for (receptor, _), message_id in zip(messages, ids)]
+
+
+@lru_cache(maxsize=None)
+def get_sms_provider():
+    return import_string(settings.SMS_PROVIDER)()
+
+
+@lru_cache(maxsize=None)
+def get_sms_batcher():
+    return MicroBatcher(
+        get_sms_provider().send_bulk, max_size=settings.SMS_BATCH_SIZE, max_wait=settings.SMS_BATCH_WAIT_MS / 1000
+    )
@@ -1,15 +1,60 @@
+from datetime import datetime
 from celery import shared_task
+from celery.signals import worker_process_shutdown, worker_shutdown
+from django.conf import settings
+from core.metrics import registry
+from accounts.mail import get_mail_batcher, get_mail_connection
+from accounts.models import OtpCode, OtpOutbox, EffortAuthenticate, RevokedToken
+from accounts.pipeline import DeliveryTimer
+from accounts.sms import get_sms_batcher
 from accounts.utils import SendCode
 
 
 send = SendCode()
 
 
+@shared_task(ignore_result=True, priority=9)
+def send_sms_code_task(phone_number, code, enqueued_at=None, expires_at=None, delivery_id=None, delivery_claim=None):
+    timer = DeliveryTimer('sms', enqueued_at, expires_at)
+    if not timer.expired() and timer.claim(delivery_id, delivery_claim):
+        send.send_sms_code(phone_number, code, timer)
+
+
+@shared_task(ignore_result=True, priority=5)
+def send_mail_code_task(email, code, enqueued_at=None, expires_at=None, delivery_id=None, delivery_claim=None):
+    timer = DeliveryTimer('email', enqueued_at, expires_at)
+    if not timer.expired() and timer.claim(delivery_id, delivery_claim):
+        send.send_mail_code(email, code, timer)
+
+
+@shared_task
+def clear_expired_otp_codes_task():
+    OtpOutbox.objects.delete_expired(batch_size=settings.OTP_SWEEP_BATCH_SIZE)
+    return OtpCode.objects.delete_expired(batch_size=settings.OTP_SWEEP_BATCH_SIZE)
+
+
+@shared_task
+def clear_expired_revoked_tokens_task():
+    return RevokedToken.objects.delete_expired(batch_size=settings.OTP_SWEEP_BATCH_SIZE)
+
+
 @shared_task
-def send_sms_code_task(phone_number, code):
-    return send.send_sms_code(phone_number, code)
+def relay_otp_outbox_task():
+    # imported here, accounts.outbox publishes the send tasks of this module
+    from accounts.outbox import relay_otp_outbox
+    return relay_otp_outbox(drain=True)
 
 
 @shared_task
-def send_mail_code_task(email, code):
-    return send.send_mail_code(email, code)
+def record_login_lockout_task(user_id, count, lock_time):
+    EffortAuthenticate.objects.create(user_id=user_id, count=count, lock_time=datetime.fromisoformat(lock_time))
+
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def flush_batchers(**kwargs):
+    get_sms_batcher().close(timeout=10)
+    get_mail_batcher().close(timeout=10)
+    get_mail_connection().close()
+    # prefork children leave through os._exit, which skips the atexit flush
+    registry.flush()
@@ -1,3 +1,980 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import requests
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+from django.contrib.auth import BACKEND_SESSION_KEY, authenticate
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.db.models.functions import Now
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.urls import resolve, reverse
+from kavenegar import HTTPException
+from rest_framework.authtoken.models import Token
+from A.celery_conf import celery_app
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+from .authentication import CachedTokenAuthentication, ClaimsTokenObtainPairSerializer
+from .batching import MicroBatcher
+from .cache import TieredCache, get_token_cache, get_user_cache
+from .checks import check_otp_metrics_cache
+from .export import export_users, filter_users
+from .forms import UserLoginPhoneNumberForm, UserRegisterUsernameForm
+from .identity import PHONE_NUMBER, get_identity_resolver
+from .ids import MAX_SEQUENCE, NODE_BITS, SEQUENCE_BITS, SnowflakeGenerator
+from .middleware import IDENTIFIER_AUTH_BACKEND
+from .models import OtpCode, OtpOutbox, RevokedToken, SnowflakeNode, User
+from .otp import CacheOtpStore, ModelOtpStore, Otp, publish_otp_code
+from .outbox import relay_otp_outbox
+from .passwords import PasswordService, PasswordServiceBusy
+from .phone import is_phone_number, normalize_phone_number
+from .revocation import RevocationList
+from .search import EstimatedCountPaginator, search_lookup, search_users
+from .sms import KavenegarSmsProvider, PooledKavenegarAPI
+from .tasks import send_sms_code_task
+from .throttling import LoginThrottle, SlidingWindowCounter, TokenBucket, get_client_ip, get_trusted_proxies
 
-# Create your tests here.
+
+class IdentityResolverTests(TestCase):
+    def test_username_shaped_like_email_or_phone_still_resolves(self):
+        for username in ('ali@home', '09121234567'):
+            user = User.objects.create_user(username=username, password='secret-password')
+            self.assertEqual(get_identity_resolver().resolve(username), user)
+
+    def test_email_and_phone_number_win_over_username(self):
+        owner = User.objects.create_user(username='owner', phone_number='09121234567', password='secret-password')
+        User.objects.create_user(username='09121234567', password='secret-password')
+        self.assertEqual(get_identity_resolver().resolve('+989121234567'), owner)
+
+    def test_registration_refuses_email_and_phone_shaped_usernames(self):
+        for username in ('ali@home', '09121234567', '9121234567'):
+            form = UserRegisterUsernameForm(data={'username': username, 'password': 'secret-password'})
+            self.assertIn('username', form.errors)
+        form = UserRegisterUsernameForm(data={'username': 'ali', 'password': 'secret-password'})
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_forms_share_the_request_resolver(self):
+        User.objects.create_user(phone_number='09121234567')
+        request = RequestFactory().post('/')
+        form = UserLoginPhoneNumberForm(request=request, data={'phone_number': '09121234567'})
+        self.assertTrue(form.is_valid(), form.errors)
+        with self.assertNumQueries(0):
+            self.assertTrue(get_identity_resolver(request).exists('09121234567', PHONE_NUMBER))
+
+
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        self.cache = TieredCache('test', local_ttl=0)
+        self.cache.shared.clear()
+
+    def test_fill_racing_a_delete_is_not_served(self):
+        def stale_loader():
+            # the row is read, then saved and invalidated before the loader stores it
+            self.cache.delete('key')
+            return 'old'
+
+        self.assertEqual(self.cache.get('key', loader=stale_loader), 'old')
+        self.assertEqual(self.cache.get('key', loader=lambda: 'new'), 'new')
+        self.assertEqual(self.cache.get('key', loader=lambda: 'newer'), 'new')
+
+    def test_stale_fill_is_not_served_after_the_generation_is_evicted(self):
+        def stale_loader():
+            self.cache.delete('key')
+            return 'old'
+
+        self.cache.get('key', loader=stale_loader)
+        self.cache.shared.delete('test:key:generation')
+        self.assertEqual(self.cache.get('key', loader=lambda: 'new'), 'new')
+
+    def test_generation_keys_expire(self):
+        with mock.patch.object(self.cache.shared, 'set', wraps=self.cache.shared.set) as set_:
+            self.cache.delete('key')
+        set_.assert_any_call('test:key:generation', mock.ANY, self.cache.timeout)
+
+    def test_delete_drops_the_entry(self):
+        self.cache.get('key', loader=lambda: 'old')
+        self.cache.delete('key')
+        self.assertEqual(self.cache.get('key', loader=lambda: 'new'), 'new')
+
+
+class FakeClock:
+    def __init__(self, now=1700000000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class ThrottlingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        patcher = mock.patch('accounts.throttling.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TokenBucketTests(ThrottlingTestCase):
+    def test_burst(self):
+        bucket = TokenBucket('test', capacity=3, refill_seconds=60)
+        self.assertEqual([bucket.consume('key') for _ in range(4)], [True, True, True, False])
+        self.assertTrue(bucket.consume('other'))
+
+    def test_refill(self):
+        bucket = TokenBucket('test', capacity=3, refill_seconds=60)
+        for _ in range(3):
+            bucket.consume('key')
+        self.clock.now += 59
+        self.assertFalse(bucket.consume('key'))
+        self.clock.now += 1
+        self.assertTrue(bucket.consume('key'))
+        self.assertFalse(bucket.consume('key'))
+        self.clock.now += 180
+        self.assertEqual([bucket.consume('key') for _ in range(4)], [True, True, True, False])
+
+    def test_denied_attempts_take_no_tokens(self):
+        bucket = TokenBucket('test', capacity=1, refill_seconds=60)
+        bucket.consume('key')
+        for _ in range(5):
+            self.assertFalse(bucket.consume('key'))
+        self.clock.now += 60
+        self.assertTrue(bucket.consume('key'))
+
+    def test_concurrent_consumers_share_the_burst(self):
+        bucket = TokenBucket('test', capacity=5, refill_seconds=60)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(bucket.consume('key'))) for _ in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 5)
+
+
+class SlidingWindowCounterTests(ThrottlingTestCase):
+    def test_previous_window_fades_out(self):
+        self.clock.now = 600.0
+        counter = SlidingWindowCounter('test', 60)
+        for _ in range(4):
+            counter.hit('key')
+        self.clock.now = 690.0
+        # half way through the next window, half of the previous hits still count
+        self.assertEqual(counter.hit('key'), 3)
+        self.clock.now = 780.0
+        self.assertEqual(counter.hit('key'), 1)
+
+    def test_reset(self):
+        counter = SlidingWindowCounter('test', 60)
+        counter.hit('key')
+        counter.reset('key')
+        self.assertEqual(counter.hit('key'), 1)
+
+
+class LoginThrottleTests(ThrottlingTestCase):
+    def test_lockout_after_user_limit(self):
+        lockouts = []
+        throttle = LoginThrottle(user_limit=3, ip_limit=100, on_lockout=lambda *args: lockouts.append(args))
+        for _ in range(2):
+            throttle.register_failure('Ali', '10.0.0.1', user='user')
+        self.assertFalse(throttle.is_locked('Ali', '10.0.0.1'))
+        throttle.register_failure('Ali', '10.0.0.1', user='user')
+        self.assertTrue(throttle.is_locked('Ali'))
+        self.assertFalse(throttle.is_locked('someone', '10.0.0.1'))
+        self.assertEqual([(user, count) for user, count, _ in lockouts], [('user', 3)])
+
+    def test_lockout_per_ip(self):
+        throttle = LoginThrottle(user_limit=100, ip_limit=3, on_lockout=None)
+        for name in ('a', 'b', 'c'):
+            throttle.register_failure(name, '10.0.0.1')
+        self.assertTrue(throttle.is_locked('d', '10.0.0.1'))
+        self.assertFalse(throttle.is_locked('d', '10.0.0.2'))
+
+    def test_success_clears_failures(self):
+        throttle = LoginThrottle(user_limit=3, on_lockout=None)
+        for _ in range(2):
+            throttle.register_failure('ali')
+        throttle.register_success('ali')
+        for _ in range(2):
+            throttle.register_failure('ali')
+        self.assertFalse(throttle.is_locked('ali'))
+
+
+class ClientIpTests(TestCase):
+    def setUp(self):
+        get_trusted_proxies.cache_clear()
+        self.addCleanup(get_trusted_proxies.cache_clear)
+
+    def request(self, remote_addr, forwarded=None):
+        extra = {'REMOTE_ADDR': remote_addr}
+        if forwarded is not None:
+            extra['HTTP_X_FORWARDED_FOR'] = forwarded
+        return RequestFactory().get('/', **extra)
+
+    def test_untrusted_peer_is_the_client(self):
+        self.assertEqual(get_client_ip(self.request('203.0.113.7', '198.51.100.1')), '203.0.113.7')
+
+    @override_settings(TRUSTED_PROXIES=['10.0.0.0/8'])
+    def test_client_behind_trusted_proxies(self):
+        request = self.request('10.0.0.2', '198.51.100.1, 203.0.113.7, 10.0.0.9')
+        self.assertEqual(get_client_ip(request), '203.0.113.7')
+        self.assertEqual(get_client_ip(self.request('10.0.0.2')), '10.0.0.2')
+
+
+class AsyncViewTests(TestCase):
+    def test_views_are_coroutine_functions(self):
+        match = resolve(reverse('accounts:async_login_phone_number'))
+        self.assertTrue(asyncio.iscoroutinefunction(match.func))
+
+    async def test_options_and_unknown_methods(self):
+        url = reverse('accounts:async_login_phone_number')
+        client = AsyncClient()
+        response = await client.options(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('POST', response['Allow'])
+        response = await client.put(url)
+        self.assertEqual(response.status_code, 405)
+
+    def test_options_through_wsgi(self):
+        response = self.client.options(reverse('accounts:async_login_phone_number'))
+        self.assertEqual(response.status_code, 200)
+
+
+class TokenRefreshTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='ali', password='secret-password')
+        self.refresh = str(ClaimsTokenObtainPairSerializer.get_token(self.user))
+        self.url = reverse('accounts:token_refresh')
+
+    def test_refresh_carries_current_claims(self):
+        self.user.is_admin = True
+        self.user.save()
+        response = self.client.post(self.url, {'refresh': self.refresh})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(AccessToken(response.json()['access'])['is_admin'])
+
+    def test_deactivated_user_cannot_refresh(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.post(self.url, {'refresh': self.refresh}).status_code, 401)
+
+    def test_deleted_user_cannot_refresh(self):
+        self.user.delete()
+        self.assertEqual(self.client.post(self.url, {'refresh': self.refresh}).status_code, 401)
+
+
+class RevocationListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ali', password='secret-password')
+
+    def token(self):
+        return ClaimsTokenObtainPairSerializer.get_token(self.user)
+
+    def test_revoked_token(self):
+        token, other = self.token(), self.token()
+        revocations = RevocationList(capacity=100)
+        revocations.revoke_token(token)
+        self.assertTrue(revocations.is_revoked(token))
+        self.assertFalse(revocations.is_revoked(other))
+        # another process learns about it on its next sync
+        self.assertTrue(RevocationList(capacity=100).is_revoked(token))
+
+    def test_revoked_user_covers_tokens_issued_up_to_the_revocation(self):
+        token = self.token()
+        revocations = RevocationList(capacity=100)
+        revocations.revoke_user(self.user.pk)
+        self.assertTrue(revocations.is_revoked(token))
+        later = self.token()
+        later.set_iat(at_time=datetime.now(timezone.utc) + timedelta(seconds=2))
+        self.assertFalse(revocations.is_revoked(later))
+
+    def test_row_committed_late_is_still_picked_up(self):
+        revocations = RevocationList(capacity=100, sync_seconds=0)
+        expire_time = datetime.now() + timedelta(days=1)
+        RevokedToken.objects.create(id=10, kind=RevokedToken.JTI, value='first', expire_time=expire_time)
+        revocations.sync()
+        token = self.token()
+        # a lower id written a few seconds ago, but only visible now, after the newer row was synced
+        late = RevokedToken.objects.create(id=5, kind=RevokedToken.JTI, value=token['jti'], expire_time=expire_time)
+        RevokedToken.objects.filter(pk=late.pk).update(created=datetime.now() - timedelta(seconds=5))
+        self.assertTrue(revocations.is_revoked(token))
+
+    def test_overlapping_syncs_add_each_row_once(self):
+        revocations = RevocationList(capacity=100, sync_seconds=0)
+        revocations.revoke_token(self.token())
+        for _ in range(3):
+            revocations.sync()
+        self.assertEqual(revocations.filter.count, 1)
+
+
+class PhoneNumberTests(TestCase):
+    def test_normalize(self):
+        for value in ('09121234567', '۰۹۱۲۱۲۳۴۵۶۷', '٠٩١٢١٢٣٤٥٦٧', '0912 123 4567', '(0912) 123-45.67', '0912\u200c1234567',
+                      '+989121234567', '+98 912 123 4567', '00989121234567', '989121234567', '9121234567'):
+            self.assertEqual(normalize_phone_number(value), '09121234567', value)
+
+    def test_leaves_other_values_alone(self):
+        for value in (None, '', '12345', '091212345678', 'ali'):
+            self.assertEqual(normalize_phone_number(value), value)
+
+    def test_is_phone_number(self):
+        self.assertTrue(is_phone_number('09121234567'))
+        for value in ('9121234567', '0912123456', '08121234567', '۰۹۱۲۱۲۳۴۵۶۷', '0912123456a'):
+            self.assertFalse(is_phone_number(value), value)
+
+
+class SnowflakeGeneratorTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock(1750000000.0)
+        patcher = mock.patch('accounts.ids.time.time', self.clock.time)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_ids_increase(self):
+        generator = SnowflakeGenerator(node_id=7)
+        ids = [generator.next_id() for _ in range(10)]
+        self.clock.now += 0.001
+        ids += generator.reserve(10)
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertTrue(all((value >> SEQUENCE_BITS) & ((1 << NODE_BITS) - 1) == 7 for value in ids))
+
+    def test_ids_keep_increasing_when_the_clock_goes_back(self):
+        generator = SnowflakeGenerator(node_id=7)
+        first = generator.next_id()
+        self.clock.now -= 5
+        self.assertGreater(generator.next_id(), first)
+
+    def test_sequence_rollover_borrows_the_next_millisecond(self):
+        generator = SnowflakeGenerator(node_id=7)
+        ids = generator.reserve(MAX_SEQUENCE + 3)
+        self.assertEqual(ids, sorted(set(ids)))
+        shift = NODE_BITS + SEQUENCE_BITS
+        self.assertEqual(ids[MAX_SEQUENCE + 1] >> shift, (ids[0] >> shift) + 1)
+        self.assertEqual(ids[MAX_SEQUENCE + 1] & MAX_SEQUENCE, 0)
+        # the clock hasn't caught up with the borrowed millisecond, the next ids still follow on
+        self.assertGreater(generator.next_id(), ids[-1])
+
+    def test_processes_lease_distinct_nodes(self):
+        first, second = SnowflakeGenerator(), SnowflakeGenerator()
+        self.assertNotEqual(first.next_id() >> SEQUENCE_BITS, second.next_id() >> SEQUENCE_BITS)
+        self.assertEqual(SnowflakeNode.objects.count(), 2)
+
+    def test_expired_lease_is_taken_over_and_replaced(self):
+        first = SnowflakeGenerator(lease_seconds=60)
+        first.next_id()
+        SnowflakeNode.objects.update(expire_time=datetime(2000, 1, 1))
+        with mock.patch('accounts.managers.random.randrange', return_value=first._node):
+            second = SnowflakeGenerator(lease_seconds=60)
+            second.next_id()
+        self.assertEqual(second._node, first._node)
+        # the first process notices the lost lease when it renews and leases another node
+        first._renew_at = 0
+        first.next_id()
+        self.assertNotEqual(first._node, second._node)
+
+    def test_forked_child_leases_its_own_node(self):
+        generator = SnowflakeGenerator()
+        generator.next_id()
+        parent_node = generator._node
+        with mock.patch('accounts.ids.os.getpid', return_value=generator._pid + 1):
+            generator.next_id()
+        self.assertNotEqual(generator._node, parent_node)
+
+
+class CreateUserTests(TestCase):
+    def test_duplicate_generated_username_is_retried(self):
+        User.objects.create_user(username='1000', password='secret-password')
+        with mock.patch('accounts.managers.allocate_username', side_effect=['1000', '1001']):
+            user = User.objects.create_user(phone_number='09121234567')
+        self.assertEqual(user.username, '1001')
+
+    def test_other_conflicts_are_raised(self):
+        User.objects.create_user(phone_number='09121234567')
+        with self.assertRaises(IntegrityError):
+            User.objects.create_user(phone_number='09121234567')
+
+
+class PasswordServiceBusyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_superuser('secret-password', 'admin@example.com', '09121234567', username='admin')
+        patcher = mock.patch.object(PasswordService, 'submit', side_effect=PasswordServiceBusy)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_admin_login_fails_instead_of_erroring(self):
+        response = self.client.post(reverse('admin:login'), {'username': 'admin', 'password': 'secret-password'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_username_login_answers_503_without_counting_a_failure(self):
+        url = reverse('accounts:login_username')
+        for _ in range(6):
+            response = self.client.post(url, {'username': 'admin', 'password': 'secret-password'})
+            self.assertEqual(response.status_code, 503)
+
+    def test_api_logins_answer_503(self):
+        data = {'username': 'admin', 'password': 'secret-password'}
+        self.assertEqual(self.client.post('/accounts/api/authenticate/token/', data).status_code, 503)
+        data = {'email': 'admin@example.com', 'password': 'secret-password'}
+        self.assertEqual(self.client.post(reverse('accounts:token_obtain_pair'), data).status_code, 503)
+
+    def test_create_user_hashes_inline(self):
+        user = User.objects.create_user(username='ali', password='secret-password')
+        self.assertTrue(user.check_password('secret-password'))
+
+
+@override_settings(OTP_OUTBOX_MAX_ATTEMPTS=3, OTP_OUTBOX_RETRY_SECONDS=5)
+class OtpOutboxTests(TestCase):
+    def setUp(self):
+        self.expire_time = datetime.now() + timedelta(minutes=2)
+        self.message = OtpOutbox.objects.create(phone_number='09121234567', code='1234', expire_time=self.expire_time)
+
+    def relay(self):
+        published = []
+        with mock.patch('accounts.outbox.publish_otp_code', lambda otp, **kwargs: published.append(kwargs)):
+            relay_otp_outbox(drain=True)
+        self.claims = [kwargs['delivery_claim'] for kwargs in published] or getattr(self, 'claims', [])
+        return [kwargs['delivery_id'] for kwargs in published]
+
+    def send(self, ok=True, retry=True, claim=None):
+        sends = []
+
+        def send_sms_code(phone_number, code, timer):
+            sends.append(code)
+            timer.finish(ok, retry=retry)
+        with mock.patch('accounts.tasks.send.send_sms_code', send_sms_code):
+            send_sms_code_task(
+                '09121234567', '1234', delivery_id=self.message.pk, delivery_claim=claim or self.claims[-1]
+            )
+        return sends
+
+    def retry_now(self):
+        OtpOutbox.objects.update(next_attempt_at=Now())
+
+    def backoff(self):
+        next_attempt_at, now = OtpOutbox.objects.annotate(now=Now()).values_list('next_attempt_at', 'now').get()
+        return (next_attempt_at - now).total_seconds()
+
+    def test_a_claimed_row_is_not_claimed_again(self):
+        self.assertEqual(len(OtpOutbox.objects.claim('a', 10, 30)), 1)
+        self.assertEqual(OtpOutbox.objects.claim('b', 10, 30), [])
+
+    def test_a_stale_unpublished_claim_is_taken_over(self):
+        OtpOutbox.objects.claim('a', 10, 30)
+        OtpOutbox.objects.update(claimed_at=Now() - timedelta(seconds=60))
+        self.assertEqual([message.claimed_by for message in OtpOutbox.objects.claim('b', 10, 30)], ['b'])
+
+    def test_a_published_row_is_not_published_again(self):
+        self.assertEqual(self.relay(), [self.message.pk])
+        OtpOutbox.objects.update(claimed_at=Now() - timedelta(days=1))
+        self.assertEqual(self.relay(), [])
+        self.assertTrue(OtpOutbox.objects.filter(pk=self.message.pk).exists())
+
+    def test_row_of_a_dead_worker_is_taken_over(self):
+        self.relay()
+        OtpOutbox.objects.start_delivery(self.message.pk, self.claims[-1])
+        self.assertEqual(self.relay(), [])
+        OtpOutbox.objects.update(claimed_at=Now() - timedelta(days=1))
+        self.assertEqual(self.relay(), [self.message.pk])
+        self.assertFalse(OtpOutbox.objects.get(pk=self.message.pk).delivering)
+
+    def test_copy_from_an_older_claim_is_dropped(self):
+        self.relay()
+        old_claim = self.claims[-1]
+        OtpOutbox.objects.start_delivery(self.message.pk, old_claim)
+        OtpOutbox.objects.update(claimed_at=Now() - timedelta(days=1))
+        self.relay()
+        self.assertEqual(self.send(claim=old_claim), [])
+        self.assertEqual(self.send(), ['1234'])
+        self.assertFalse(OtpOutbox.objects.exists())
+
+    def test_relay_drops_expired_rows(self):
+        OtpOutbox.objects.update(expire_time=datetime.now() - timedelta(seconds=1))
+        self.assertEqual(self.relay(), [])
+        self.assertFalse(OtpOutbox.objects.exists())
+
+    def test_failed_publish_releases_the_rest_of_the_batch(self):
+        expired = OtpOutbox.objects.create(phone_number='09121234568', code='5678', expire_time=datetime.now())
+        third = OtpOutbox.objects.create(phone_number='09121234569', code='9012', expire_time=self.expire_time)
+        with mock.patch('accounts.outbox.publish_otp_code', side_effect=[None, ConnectionError]):
+            with self.assertRaises(ConnectionError):
+                relay_otp_outbox()
+        self.assertIsNotNone(OtpOutbox.objects.get(pk=self.message.pk).published_at)
+        self.assertFalse(OtpOutbox.objects.filter(pk=expired.pk).exists())
+        self.assertIsNone(OtpOutbox.objects.get(pk=third.pk).claimed_at)
+        self.assertEqual(self.relay(), [third.pk])
+
+    def test_sent_row_is_deleted_and_repeats_dropped(self):
+        self.relay()
+        self.assertEqual(self.send(), ['1234'])
+        self.assertFalse(OtpOutbox.objects.exists())
+        self.assertEqual(self.send(), [])
+
+    def test_failed_send_is_retried_after_a_backoff(self):
+        self.relay()
+        self.assertEqual(self.send(ok=False), ['1234'])
+        message = OtpOutbox.objects.get(pk=self.message.pk)
+        self.assertEqual((message.attempts, message.delivering, message.claimed_by), (1, False, None))
+        self.assertAlmostEqual(self.backoff(), 5, delta=1)
+        self.assertEqual(self.relay(), [])
+        self.retry_now()
+        self.assertEqual(self.relay(), [self.message.pk])
+        self.assertEqual(self.send(), ['1234'])
+        self.assertFalse(OtpOutbox.objects.exists())
+
+    def test_backoff_doubles_until_the_attempts_run_out(self):
+        delays = []
+        for _ in range(2):
+            self.relay()
+            self.send(ok=False)
+            delays.append(self.backoff())
+            self.retry_now()
+        self.assertAlmostEqual(delays[0], 5, delta=1)
+        self.assertAlmostEqual(delays[1], 10, delta=1)
+        self.relay()
+        self.send(ok=False)
+        self.assertFalse(OtpOutbox.objects.exists())
+
+    def test_send_that_may_have_reached_the_provider_is_not_retried(self):
+        self.relay()
+        self.assertEqual(self.send(ok=False, retry=False), ['1234'])
+        self.assertFalse(OtpOutbox.objects.exists())
+
+
+class OtpStoreTestsMixin:
+    def get_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.get_store()
+        self.store.add('1234', phone_number='09121234567')
+
+    def test_right_code_is_popped_once(self):
+        otp = self.store.pop('1234', '09121234567')
+        self.assertEqual((otp.code, otp.phone_number), ('1234', '09121234567'))
+        self.assertIsNone(self.store.pop('1234', '09121234567'))
+
+    def test_code_of_another_destination_is_refused(self):
+        self.assertIsNone(self.store.pop('1234', '09121234568'))
+        self.assertIsNone(self.store.pop('1234', None))
+
+    @override_settings(OTP_MAX_ATTEMPTS=5)
+    def test_wrong_guesses_burn_the_code(self):
+        for _ in range(4):
+            self.assertIsNone(self.store.pop('0000', '09121234567'))
+        self.assertIsNone(self.store.pop('0001', '09121234567'))
+        self.assertIsNone(self.store.pop('1234', '09121234567'))
+
+    @override_settings(OTP_MAX_ATTEMPTS=5)
+    def test_a_new_code_resets_the_attempts(self):
+        for _ in range(4):
+            self.store.pop('0000', '09121234567')
+        self.store.add('5678', phone_number='09121234567')
+        self.store.pop('0000', '09121234567')
+        self.assertIsNotNone(self.store.pop('5678', '09121234567'))
+
+
+class ModelOtpStoreTests(OtpStoreTestsMixin, TestCase):
+    def get_store(self):
+        return ModelOtpStore()
+
+    def test_popped_codes_are_deleted(self):
+        self.store.pop('1234', '09121234567')
+        self.assertFalse(OtpCode.objects.exists())
+
+
+class CacheOtpStoreTests(OtpStoreTestsMixin, TestCase):
+    def get_store(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        caches_setting = {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'otp': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory.name},
+        }
+        with override_settings(CACHES=caches_setting):
+            store = CacheOtpStore('otp')
+        self.addCleanup(store.cache.clear)
+        return store
+
+    def test_process_local_cache_is_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            CacheOtpStore('default')
+
+
+class VerifyOtpCodeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(phone_number='09121234567')
+        with mock.patch('accounts.otp.random.randint', return_value=1234):
+            self.client.post(reverse('accounts:login_phone_number'), {'phone_number': '09121234567'})
+
+    def verify(self, code):
+        return self.client.post(reverse('accounts:verify_otp'), {'code': code})
+
+    def test_code_logs_in_once(self):
+        self.assertRedirects(self.verify('1234'), reverse('core:home'), fetch_redirect_response=False)
+        self.assertEqual(self.client.session['_auth_user_id'], str(self.user.pk))
+        self.client.logout()
+        self.assertEqual(self.verify('1234').status_code, 200)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    @override_settings(OTP_MAX_ATTEMPTS=5)
+    def test_code_is_burnt_after_wrong_guesses(self):
+        for _ in range(5):
+            self.assertEqual(self.verify('0000').status_code, 200)
+        self.assertEqual(self.verify('1234').status_code, 200)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+
+class MicroBatcherTests(TestCase):
+    def make_batcher(self, handler=None, **kwargs):
+        self.batches = []
+
+        def record(items):
+            self.batches.append(items)
+            return [item * 2 for item in items]
+        batcher = MicroBatcher(handler or record, **kwargs)
+        self.addCleanup(batcher.close, 1)
+        return batcher
+
+    def test_full_batch_is_flushed_without_waiting(self):
+        batcher = self.make_batcher(max_size=3, max_wait=60)
+        futures = [batcher.submit(item) for item in (1, 2, 3)]
+        self.assertEqual([future.result(timeout=5) for future in futures], [2, 4, 6])
+        self.assertEqual(self.batches, [[1, 2, 3]])
+
+    def test_partial_batch_is_flushed_after_max_wait(self):
+        batcher = self.make_batcher(max_size=100, max_wait=0.01)
+        self.assertEqual(batcher.submit(1).result(timeout=5), 2)
+        self.assertEqual(batcher.submit(2).result(timeout=5), 4)
+        self.assertEqual(self.batches, [[1], [2]])
+
+    def test_missing_results_fail_their_futures(self):
+        batcher = self.make_batcher(lambda items: items[:1], max_size=2, max_wait=60)
+        first, second = batcher.submit(1), batcher.submit(2)
+        self.assertEqual(first.result(timeout=5), 1)
+        with self.assertRaises(RuntimeError):
+            second.result(timeout=5)
+
+    def test_handler_error_fails_every_future(self):
+        batcher = self.make_batcher(mock.Mock(side_effect=ValueError), max_size=2, max_wait=60)
+        futures = [batcher.submit(item) for item in (1, 2)]
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(timeout=5)
+
+    def test_close_flushes_pending_items(self):
+        batcher = self.make_batcher(max_size=100, max_wait=60)
+        future = batcher.submit(1)
+        batcher.close(5)
+        self.assertEqual(future.result(timeout=0), 2)
+
+
+class KavenegarRetryTests(TestCase):
+    def setUp(self):
+        self.api = PooledKavenegarAPI('key', retries=2, backoff=0)
+        self.post = mock.Mock()
+        self.api._session, self.api._pid = mock.Mock(post=self.post), os.getpid()
+
+    def request(self):
+        return self.api._request('sms', 'send', {'receptor': '09121234567'})
+
+    def test_refused_connection_is_retried(self):
+        refused = MaxRetryError(None, '/', NewConnectionError(None, 'refused'))
+        response = mock.Mock(content=b'{"return": {"status": 200}, "entries": []}')
+        self.post.side_effect = [
+            requests.exceptions.ConnectionError(refused), requests.exceptions.ConnectTimeout(), response,
+        ]
+        self.assertEqual(self.request(), [])
+        self.assertEqual(self.post.call_count, 3)
+
+    def test_aborted_connection_is_not_retried(self):
+        aborted = ProtocolError('Connection aborted.', ConnectionResetError())
+        self.post.side_effect = requests.exceptions.ConnectionError(aborted)
+        with self.assertRaises(HTTPException):
+            self.request()
+        self.assertEqual(self.post.call_count, 1)
+
+    def test_read_timeout_is_not_retried(self):
+        self.post.side_effect = requests.exceptions.ReadTimeout()
+        with self.assertRaises(HTTPException):
+            self.request()
+        self.assertEqual(self.post.call_count, 1)
+
+
+class KavenegarSmsProviderTests(TestCase):
+    def setUp(self):
+        self.provider = KavenegarSmsProvider('key')
+        self.provider.api.backoff = 0
+        self.post = mock.Mock()
+        self.provider.api._session, self.provider.api._pid = mock.Mock(post=self.post), os.getpid()
+
+    def test_read_timeout_may_have_sent_the_sms(self):
+        self.post.side_effect = requests.exceptions.ReadTimeout()
+        result = self.provider.send('09121234567', '1234')
+        self.assertEqual((result.ok, result.maybe_sent), (False, True))
+
+    def test_refused_connection_did_not_send_the_sms(self):
+        self.post.side_effect = requests.exceptions.ConnectTimeout()
+        results = self.provider.send_bulk([('09121234567', '1234'), ('09121234568', '5678')])
+        self.assertEqual([(result.ok, result.maybe_sent) for result in results], [(False, False)] * 2)
+
+    def test_rejected_request_did_not_send_the_sms(self):
+        self.post.return_value = mock.Mock(content=b'{"return": {"status": 411, "message": "invalid receptor"}}')
+        result = self.provider.send('09121234567', '1234')
+        self.assertEqual((result.ok, result.maybe_sent), (False, False))
+
+
+class LegacyAuthBackendTests(TestCase):
+    def test_session_of_a_removed_backend_stays_logged_in(self):
+        user = User.objects.create_user(username='ali', password='secret-password')
+        for backend in ('django.contrib.auth.backends.ModelBackend', 'accounts.authenticate.UsernameAuthBackend'):
+            self.client.force_login(user, backend=IDENTIFIER_AUTH_BACKEND)
+            session = self.client.session
+            session[BACKEND_SESSION_KEY] = backend
+            session.save()
+            response = self.client.get(reverse('core:home'))
+            self.assertEqual(response.wsgi_request.user, user)
+            self.assertEqual(self.client.session[BACKEND_SESSION_KEY], IDENTIFIER_AUTH_BACKEND)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_user_cache().local.clear()
+        get_token_cache().local.clear()
+        self.user = User.objects.create_user(username='ali', password='secret-password')
+        self.token = Token.objects.create(user=self.user)
+        self.authentication = CachedTokenAuthentication()
+
+    def authenticate(self):
+        return self.authentication.authenticate_credentials(self.token.key)[0]
+
+    def test_second_request_is_served_from_the_cache(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.authenticate(), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(), self.user)
+
+    def test_deactivated_user_is_rejected(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deleted_user_is_rejected(self):
+        self.authenticate()
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deleted_token_is_rejected(self):
+        self.authenticate()
+        self.token.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+
+class ImportUsersTests(TestCase):
+    def import_users(self, name, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path, rejects = f'{directory.name}/{name}', f'{directory.name}/rejects'
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        call_command('import_users', path, '--workers', '1', '--reject-file', rejects, stdout=io.StringIO())
+        with open(rejects, encoding='utf-8') as stream:
+            return stream.read()
+
+    def test_jsonl_rejects_keep_the_original_line(self):
+        User.objects.create_user(username='taken')
+        lines = [
+            '{"username": "ali", "email": "ali@example.com"}',
+            '{"username": "reza", "email": "ali@example.com"}',
+            '{"username": "taken"}',
+            '{"username": ',
+            '["not", "an", "object"]',
+            '{"username": "sara", "phone_number": "0912"}',
+        ]
+        rejects = [json.loads(line) for line in self.import_users('users.jsonl', '\n'.join(lines)).splitlines()]
+        reasons = {reject['line']: reject['reason'] for reject in rejects}
+        self.assertEqual(sorted(reasons), sorted(lines[1:]))
+        self.assertEqual(reasons[lines[1]], 'duplicate email in input')
+        self.assertEqual(reasons[lines[2]], 'username already exists')
+        self.assertTrue(reasons[lines[3]].startswith('line 4: invalid json'))
+        self.assertEqual(reasons[lines[4]], 'line 5: expected a json object')
+        self.assertEqual(list(User.objects.order_by('username').values_list('username', flat=True)), ['ali', 'taken'])
+
+    def test_csv_rejects_can_be_imported_again(self):
+        content = 'username,email,password\nali,ali@example.com,secret-password\nreza,ali@example.com,"a,b"\n'
+        rejects = list(csv.DictReader(io.StringIO(self.import_users('users.csv', content))))
+        self.assertEqual([(reject['reason'], reject['line']) for reject in rejects], [
+            ('duplicate email in input', 'reza,ali@example.com,"a,b"'),
+        ])
+        self.assertTrue(User.objects.get(username='ali').check_password('secret-password'))
+
+
+class ExportUsersTests(TestCase):
+    def setUp(self):
+        self.ali = User.objects.create_user(username='ali', email='ali@example.com', phone_number='09121234567')
+        self.reza = User.objects.create_user(username='reza')
+        User.objects.filter(pk=self.reza.pk).update(is_active=False)
+
+    def test_export_is_lazy(self):
+        with self.assertNumQueries(0):
+            content, content_type = export_users(User.objects.all(), 'csv')
+        self.assertEqual(content_type, 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(''.join(content))))
+        self.assertEqual([row['username'] for row in rows], ['ali', 'reza'])
+        self.assertEqual(rows[0]['phone_number'], '09121234567')
+        self.assertEqual(rows[0]['created'], self.ali.created.isoformat())
+
+    def test_jsonl_export_of_filtered_users(self):
+        content, content_type = export_users(filter_users(User.objects.all(), is_active=True), 'jsonl', chunk_size=1)
+        rows = [json.loads(line) for line in content]
+        self.assertEqual(content_type, 'application/x-ndjson')
+        self.assertEqual([(row['id'], row['username'], row['is_active']) for row in rows], [(self.ali.pk, 'ali', True)])
+
+    def test_command_writes_the_filtered_users(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f'{directory.name}/users.jsonl'
+        stdout = io.StringIO()
+        call_command('export_users', '--output', path, '--is-active', 'no', stdout=stdout)
+        with open(path, encoding='utf-8') as stream:
+            self.assertEqual([json.loads(line)['username'] for line in stream], ['reza'])
+        self.assertIn('1 users exported', stdout.getvalue())
+
+    def test_admin_action_streams_the_selection(self):
+        admin = User.objects.create_superuser('secret-password', 'admin@example.com', '09121234568', username='admin')
+        self.client.force_login(admin, backend=IDENTIFIER_AUTH_BACKEND)
+        response = self.client.post(reverse('admin:accounts_user_changelist'), {
+            'action': 'export_csv', '_selected_action': [self.ali.pk],
+        })
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="users.csv"')
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['username'] for row in rows], ['ali'])
+
+
+class SearchUsersTests(TestCase):
+    def test_lookup_follows_the_shape_of_the_term(self):
+        self.assertEqual(search_lookup(' Ali@Example.COM '), {'email__startswith': 'Ali@example.com'})
+        self.assertEqual(search_lookup('09121234567'), {'phone_number': '09121234567'})
+        self.assertEqual(search_lookup('+989121234567'), {'phone_number': '09121234567'})
+        self.assertEqual(search_lookup('0912'), {'phone_number__startswith': '0912'})
+        self.assertEqual(search_lookup('ali'), {'username__startswith': 'ali'})
+
+    def test_persian_digits_find_the_phone_number(self):
+        user = User.objects.create_user(username='ali', phone_number='09121234567')
+        User.objects.create_user(username='reza', phone_number='09351234567')
+        self.assertEqual(list(search_users(User.objects.all(), '۰۹۱۲۱۲۳۴۵۶۷')), [user])
+        self.assertEqual(list(search_users(User.objects.all(), '۰۹۱۲')), [user])
+
+    def test_blank_term_keeps_the_queryset(self):
+        queryset = User.objects.all()
+        self.assertIs(search_users(queryset, '  '), queryset)
+
+    @override_settings(ADMIN_SEARCH_COUNT_LIMIT=2)
+    def test_count_is_capped(self):
+        for username in ('ali', 'alireza', 'alma'):
+            User.objects.create_user(username=username)
+        paginator = EstimatedCountPaginator(search_users(User.objects.order_by('pk'), 'al'), 1)
+        self.assertEqual(paginator.count, 2)
+        paginator = EstimatedCountPaginator(search_users(User.objects.order_by('pk'), 'alm'), 1)
+        self.assertEqual(paginator.count, 1)
+
+    def test_admin_search_uses_the_prefix_lookup(self):
+        admin = User.objects.create_superuser('secret-password', 'admin@example.com', '09121234568', username='admin')
+        User.objects.create_user(username='ali', phone_number='09121234567')
+        self.client.force_login(admin, backend=IDENTIFIER_AUTH_BACKEND)
+        response = self.client.get(reverse('admin:accounts_user_changelist'), {'q': '۰۹۱۲۱۲۳۴۵۶۷'})
+        self.assertEqual([user.username for user in response.context['cl'].result_list], ['ali'])
+
+
+@override_settings(PASSWORD_PBKDF2_ITERATIONS=2000)
+class PasswordUpgradeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('accounts.authenticate.get_password_service', return_value=PasswordService(workers=0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login_upgrades(self, encoded):
+        user = User.objects.create_user(username='ali')
+        User.objects.filter(pk=user.pk).update(password=encoded)
+        self.assertEqual(authenticate(username='ali', password='secret-password'), user)
+        return User.objects.get(pk=user.pk).password
+
+    def test_login_upgrades_an_older_hasher(self):
+        encoded = make_password('secret-password', hasher='pbkdf2_sha1')
+        self.assertTrue(self.login_upgrades(encoded).startswith('pbkdf2_sha256$2000$'))
+
+    def test_login_upgrades_the_work_factor(self):
+        with self.settings(PASSWORD_PBKDF2_ITERATIONS=1000):
+            encoded = make_password('secret-password')
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(self.login_upgrades(encoded).startswith('pbkdf2_sha256$2000$'))
+
+    def test_current_hash_is_left_alone(self):
+        encoded = make_password('secret-password')
+        self.assertEqual(self.login_upgrades(encoded), encoded)
+
+    def test_otp_registration_leaves_no_usable_password(self):
+        with mock.patch('accounts.otp.random.randint', return_value=1234):
+            self.client.post(reverse('accounts:register_phone_number'), {'phone_number': '09121234567'})
+        self.client.post(reverse('accounts:verify_otp'), {'code': '1234'})
+        user = User.objects.get(phone_number='09121234567')
+        self.assertFalse(user.has_usable_password())
+
+
+class OtpMetricsCacheCheckTests(TestCase):
+    def test_process_local_cache_is_reported(self):
+        self.assertEqual([warning.id for warning in check_otp_metrics_cache(None)], ['accounts.W001'])
+        caches_setting = {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'shared': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        }
+        with self.settings(CACHES=caches_setting, OTP_METRICS_CACHE_ALIAS='shared'):
+            self.assertEqual(check_otp_metrics_cache(None), [])
+
+
+class OtpTaskRoutingTests(TestCase):
+    def publish(self, **destination):
+        expire_time = datetime.now() + timedelta(seconds=120)
+        otp = Otp('1234', destination.get('phone_number'), destination.get('email'), expire_time)
+        with mock.patch.object(celery_app.amqp, 'send_task_message') as send:
+            publish_otp_code(otp, delivery_id=7)
+        (producer, name, message), options = send.call_args
+        args, kwargs, _ = message.body
+        return name, args, kwargs, options, expire_time
+
+    def test_sms_code_goes_to_the_sms_queue(self):
+        name, args, kwargs, options, expire_time = self.publish(phone_number='09121234567')
+        self.assertEqual((name, args), ('accounts.tasks.send_sms_code_task', ('09121234567', '1234')))
+        self.assertEqual((options['queue'].name, options['queue'].routing_key), ('otp_sms', 'otp_sms'))
+        self.assertEqual((options['queue'].max_priority, options['priority']), (10, 9))
+        self.assertAlmostEqual(options['expiration'], 120, delta=2)
+        self.assertEqual((kwargs['delivery_id'], kwargs['expires_at']), (7, expire_time.timestamp()))
+
+    def test_mail_code_goes_to_the_email_queue(self):
+        name, args, kwargs, options, expire_time = self.publish(email='ali@example.com')
+        self.assertEqual((name, args), ('accounts.tasks.send_mail_code_task', ('ali@example.com', '1234')))
+        self.assertEqual((options['queue'].name, options['queue'].routing_key), ('otp_email', 'otp_email'))
+        self.assertEqual((options['queue'].max_priority, options['priority']), (10, 5))
+        self.assertAlmostEqual(options['expiration'], 120, delta=2)
+
+    def test_every_queue_has_its_own_binding(self):
+        bindings = [(queue.exchange.name, queue.routing_key) for queue in celery_app.amqp.queues.values()]
+        self.assertEqual(len(set(bindings)), len(bindings))
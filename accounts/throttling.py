@@ -0,0 +1,193 @@
+import hashlib
+import ipaddress
+import math
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import caches
+from .identity import classify, normalize
+from .tasks import record_login_lockout_task
+
+
+@lru_cache(maxsize=None)
+def get_trusted_proxies():
+    return tuple(ipaddress.ip_network(proxy, strict=False) for proxy in settings.TRUSTED_PROXIES)
+
+
+def is_trusted_proxy(ip):
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in network for network in get_trusted_proxies())
+
+
+def get_client_ip(request):
+    if request is None:
+        return None
+    ip = request.META.get('REMOTE_ADDR')
+    if not is_trusted_proxy(ip):
+        return ip
+    # walk X-Forwarded-For back from the nearest hop, the first address no trusted proxy added is the client
+    forwarded = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+    for hop in reversed([hop for hop in forwarded if hop]):
+        if not is_trusted_proxy(hop):
+            return hop
+        ip = hop
+    return ip
+
+
+def hash_key(value):
+    return hashlib.sha1(value.encode()).hexdigest()
+
+
+class SlidingWindowCounter:
+    def __init__(self, prefix, window, alias='default'):
+        self.prefix = prefix
+        self.window = window
+        self.cache = caches[alias]
+
+    def _slots(self, key, now):
+        slot = int(now // self.window)
+        return f'{self.prefix}:{key}:{slot}', f'{self.prefix}:{key}:{slot - 1}', (now % self.window) / self.window
+
+    def _weighted(self, current, previous, elapsed):
+        return previous * (1 - elapsed) + current
+
+    def hit(self, key):
+        current_key, previous_key, elapsed = self._slots(key, time.time())
+        self.cache.add(current_key, 0, self.window * 2)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            # the slot expired between add() and incr()
+            self.cache.set(current_key, 1, self.window * 2)
+            current = 1
+        return self._weighted(current, self.cache.get(previous_key, 0), elapsed)
+
+    def reset(self, key):
+        current_key, previous_key, _ = self._slots(key, time.time())
+        self.cache.delete_many([current_key, previous_key])
+
+
+def record_lockout(user, count, lock_time):
+    record_login_lockout_task.delay(user.pk, count, lock_time.isoformat())
+
+
+class LoginThrottle:
+    def __init__(self, window=300, user_limit=5, ip_limit=50, lock_seconds=900, alias='default',
+                 on_lockout=record_lockout):
+        self.user_limit = user_limit
+        self.ip_limit = ip_limit
+        self.lock_seconds = lock_seconds
+        self.on_lockout = on_lockout
+        self.cache = caches[alias]
+        self.counter = SlidingWindowCounter('login_attempts', window, alias=alias)
+
+    @staticmethod
+    def identity_key(identifier):
+        return 'user:' + hash_key(normalize(identifier, classify(identifier)))
+
+    @staticmethod
+    def ip_key(ip):
+        return f'ip:{ip}'
+
+    def lock_key(self, key):
+        return f'login_lock:{key}'
+
+    def is_locked(self, identifier, ip=None):
+        keys = [self.lock_key(self.identity_key(identifier))]
+        if ip:
+            keys.append(self.lock_key(self.ip_key(ip)))
+        return bool(self.cache.get_many(keys))
+
+    def register_failure(self, identifier, ip=None, user=None):
+        key = self.identity_key(identifier)
+        count = self.counter.hit(key)
+        if count >= self.user_limit:
+            self.cache.set(self.lock_key(key), 1, self.lock_seconds)
+            self.counter.reset(key)
+            if user is not None and self.on_lockout is not None:
+                self.on_lockout(user, int(count), datetime.now() + timedelta(seconds=self.lock_seconds))
+        if ip:
+            key = self.ip_key(ip)
+            if self.counter.hit(key) >= self.ip_limit:
+                self.cache.set(self.lock_key(key), 1, self.lock_seconds)
+                self.counter.reset(key)
+
+    def register_success(self, identifier):
+        self.counter.reset(self.identity_key(identifier))
+
+
+@lru_cache(maxsize=None)
+def get_login_throttle():
+    return LoginThrottle(
+        window=settings.LOGIN_THROTTLE_WINDOW,
+        user_limit=settings.LOGIN_THROTTLE_USER_LIMIT,
+        ip_limit=settings.LOGIN_THROTTLE_IP_LIMIT,
+        lock_seconds=settings.LOGIN_THROTTLE_LOCK_SECONDS,
+        alias=settings.LOGIN_THROTTLE_CACHE_ALIAS,
+    )
+
+
+class TokenBucket:
+    def __init__(self, prefix, capacity, refill_seconds, alias='default'):
+        self.prefix = prefix
+        self.capacity = capacity
+        self.interval = int(refill_seconds * 1000)
+        self.cache = caches[alias]
+
+    @staticmethod
+    def ttl(milliseconds):
+        return math.ceil(milliseconds / 1000) + 1
+
+    def consume(self, key):
+        # the stored value is the time (ms) at which the bucket is full again and the key expires about
+        # then, so an idle bucket starts over through add() and a live one only changes by incr/decr;
+        # concurrent consumers never overwrite each other's tokens
+        key, now = f'{self.prefix}:{key}', int(time.time() * 1000)
+        if self.cache.add(key, now + self.interval, self.ttl(self.interval)):
+            return True
+        try:
+            full_at = self.cache.incr(key, self.interval)
+        except ValueError:
+            # expired between add() and incr(), so the bucket is full again
+            self.cache.add(key, now + self.interval, self.ttl(self.interval))
+            return True
+        if full_at - now > self.capacity * self.interval:
+            self.cache.decr(key, self.interval)
+            return False
+        self.cache.touch(key, self.ttl(full_at - now))
+        return True
+
+
+class OtpRateLimited(Exception):
+    pass
+
+
+class OtpRateLimiter:
+    def __init__(self, destination_burst=3, destination_refill_seconds=120, ip_burst=20, ip_refill_seconds=15,
+                 alias='default'):
+        self.destination_bucket = TokenBucket('otp_rate:destination', destination_burst, destination_refill_seconds,
+                                              alias=alias)
+        self.ip_bucket = TokenBucket('otp_rate:ip', ip_burst, ip_refill_seconds, alias=alias)
+
+    def check_ip(self, ip):
+        if ip and not self.ip_bucket.consume(ip):
+            raise OtpRateLimited(ip)
+
+    def check_destination(self, destination):
+        if not self.destination_bucket.consume(hash_key(destination)):
+            raise OtpRateLimited(destination)
+
+
+@lru_cache(maxsize=None)
+def get_otp_rate_limiter():
+    return OtpRateLimiter(
+        destination_burst=settings.OTP_DESTINATION_BURST,
+        destination_refill_seconds=settings.OTP_DESTINATION_REFILL_SECONDS,
+        ip_burst=settings.OTP_IP_BURST,
+        ip_refill_seconds=settings.OTP_IP_REFILL_SECONDS,
+        alias=settings.OTP_RATE_LIMIT_CACHE_ALIAS,
+    )
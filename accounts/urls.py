@@ -19,6 +19,16 @@ register = [
     path('combine/', views.UserRegisterCombineView.as_view(), name='register_combine'),
 ]
 
+async_otp = [
+    path('login/phone_number/', views.AsyncUserLoginPhoneNumberView.as_view(), name='async_login_phone_number'),
+    path('login/email/', views.AsyncUserLoginEmailView.as_view(), name='async_login_email'),
+    path('login/combine/', views.AsyncUserLoginCombineView.as_view(), name='async_login_combine'),
+    path('register/phone_number/', views.AsyncUserRegisterPhoneNumberView.as_view(), name='async_register_phone_number'),
+    path('register/email/', views.AsyncUserRegisterEmailView.as_view(), name='async_register_email'),
+    path('register/combine/', views.AsyncUserRegisterCombineView.as_view(), name='async_register_combine'),
+    path('verify_otp_code/', views.AsyncVerifyOtpCodeView.as_view(), name='async_verify_otp'),
+]
+
 urlpatterns = [
     path('logout/', views.UserLogoutView.as_view(), name='logout'),
     path('login/', include(login)),
@@ -27,4 +37,5 @@ urlpatterns = [
     path('login_and_register/github/', TemplateView.as_view(template_name='accounts/github.html'), name='login_register_github'),
     path('login_and_register/google/', TemplateView.as_view(template_name='accounts/google.html'), name='login_register_google'),
     path('api/', include('accounts.api_urls')),
+    path('async/', include(async_otp)),
 ]
@@ -1,33 +1,80 @@
-from django.core.mail import send_mail
+import socket
+import logging
+import smtplib
+from django.conf import settings
+from django.core.mail import send_mail, EmailMessage
 from django.utils.translation import gettext_lazy as _
-from kavenegar import *
+from .mail import get_mail_batcher
+from .sms import get_sms_provider, get_sms_batcher
 
-from A import local_settings
+
+logger = logging.getLogger(__name__)
+
+# a code is only sent again when the failure shows it never left; anything else may have been delivered
+MAIL_CONNECT_ERRORS = (ConnectionRefusedError, socket.gaierror, smtplib.SMTPConnectError)
 
 
 class SendCode:
-    API_KEY = local_settings.KAVE_API_KEY
-    SENDER = local_settings.KAVE_SENDER
 
-    def send(self, receiver, message):
+    @staticmethod
+    def report_sms(result):
+        if result.ok:
+            logger.info('sms sent', extra={'receptor': result.receptor, 'message_id': result.message_id})
+        else:
+            logger.warning('sms failed', extra={'receptor': result.receptor, 'error': result.error})
+        return result
+
+    def report_sms_future(self, future, timer=None):
         try:
-            api = KavenegarAPI(self.API_KEY)
-            params = {
-                'sender': self.SENDER,
-                'receptor': receiver,
-                'message': message,
-            }
-            response = api.sms_send(params)
-            print(response)
-        except APIException as e:
-            print(e)
-        except HTTPException as e:
-            print(e)
-
-    def send_sms_code(self, phone_number, code):
-        self.send(receiver=phone_number, message=code)
-        return code
+            result = self.report_sms(future.result())
+        except Exception as e:
+            logger.exception('sms batch failed', extra={'error': str(e)})
+            result = None
+        if timer is not None:
+            timer.finish(result is not None and result.ok, retry=result is not None and not result.maybe_sent)
 
     @staticmethod
-    def send_mail_code(email, code):
-        return send_mail(_('Otp Code'), code, 'support@alirezafaizi.ir', [email])
+    def report_mail_future(future, timer=None):
+        try:
+            future.result()
+            ok, retry = True, False
+        except Exception as e:
+            logger.exception('mail batch failed', extra={'error': str(e)})
+            ok, retry = False, isinstance(e, MAIL_CONNECT_ERRORS)
+        if timer is not None:
+            timer.finish(ok, retry=retry)
+
+    def send(self, receiver, message, timer=None):
+        if settings.SMS_DELIVERY_MODE == 'batch':
+            future = get_sms_batcher().submit((receiver, message))
+            future.add_done_callback(lambda future: self.report_sms_future(future, timer))
+            return None
+        try:
+            result = self.report_sms(get_sms_provider().send(receiver, message))
+        except Exception:
+            if timer is not None:
+                timer.finish(False, retry=False)
+            raise
+        if timer is not None:
+            timer.finish(result.ok, retry=not result.maybe_sent)
+        return result
+
+    def send_sms_code(self, phone_number, code, timer=None):
+        self.send(receiver=phone_number, message=code, timer=timer)
+        return code
+
+    def send_mail_code(self, email, code, timer=None):
+        if settings.MAIL_DELIVERY_MODE == 'batch':
+            message = EmailMessage(_('Otp Code'), code, 'support@alirezafaizi.ir', [email])
+            future = get_mail_batcher().submit(message)
+            future.add_done_callback(lambda future: self.report_mail_future(future, timer))
+            return None
+        try:
+            sent = send_mail(_('Otp Code'), code, 'support@alirezafaizi.ir', [email])
+        except Exception as e:
+            if timer is not None:
+                timer.finish(False, retry=isinstance(e, MAIL_CONNECT_ERRORS))
+            raise
+        if timer is not None:
+            timer.finish(bool(sent))
+        return sent
@@ -1,11 +1,8 @@
 from django.core.exceptions import ValidationError
-import convert_numbers
 from django.utils.translation import gettext_lazy as _
+from .phone import normalize_phone_number, is_phone_number
 
 
 def check_phone_number(value):
-    value = convert_numbers.persian_to_english(value)
-    if len(value) > 11 or len(value) < 11:
-        raise ValidationError(_('This number is not a valid phone number.'))
-    if not value.startswith('09'):
+    if not is_phone_number(normalize_phone_number(value)):
         raise ValidationError(_('This number is not a valid phone number.'))
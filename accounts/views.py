@@ -1,14 +1,17 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
 from django.views.generic.base import View
 from django.contrib.auth import logout
+from functools import update_wrapper
 from .forms import UserLoginUsernameForm, UserRegisterUsernameForm, UserLoginPhoneNumberForm, UserRegisterPhoneNumberForm, \
     VerifyOtpCodeForm, UserLoginEmailForm, UserRegisterEmailForm, UserLoginCombineForm, UserRegisterCombineForm
 from django.contrib import messages
+from rest_framework_simplejwt.views import TokenViewBase
 from django.utils.translation import gettext_lazy as _
-from .models import User, OtpCode
-import random
-from .tasks import send_sms_code_task, send_mail_code_task
-from datetime import datetime, timedelta
+from .models import User
+from .otp import send_otp_code, asend_otp_code
+from .passwords import get_password_service, PasswordServiceBusy
+from .throttling import get_otp_rate_limiter, get_client_ip, OtpRateLimited
 
 
 class BaseView(View):
@@ -32,13 +35,36 @@ class BaseView(View):
         pass
 
 
+class BaseOtpView(BaseView):
+    def post(self, request):
+        try:
+            get_otp_rate_limiter().check_ip(get_client_ip(request))
+            return super().post(request)
+        except OtpRateLimited:
+            messages.warning(request, _('Too many code requests, please try again later.'))
+            return render(request, self.template_name, {"form": self.class_form()}, status=429)
+
+
+class BasePasswordView(BaseView):
+    def post(self, request):
+        try:
+            return super().post(request)
+        except PasswordServiceBusy:
+            messages.warning(request, _('The server is busy, please try again in a moment.'))
+            return render(request, self.template_name, {"form": self.class_form()}, status=503)
+
+
 class UserLogoutView(View):
     def get(self, request):
         logout(request)
         return redirect('core:home')
 
 
-class UserLoginUsernameView(BaseView):
+class TokenRevokeView(TokenViewBase):
+    _serializer_class = 'accounts.authentication.TokenRevokeSerializer'
+
+
+class UserLoginUsernameView(BasePasswordView):
     template_name = 'accounts/login_username.html'
     class_form = UserLoginUsernameForm
     form_need_request = True
@@ -48,39 +74,38 @@ class UserLoginUsernameView(BaseView):
         return redirect('core:home')
 
 
-class UserRegisterUsernameView(BaseView):
+class UserRegisterUsernameView(BasePasswordView):
     template_name = 'accounts/register_username.html'
     class_form = UserRegisterUsernameForm
+    form_need_request = True
 
     def is_valid(self, request, form):
         cd = form.cleaned_data
-        User.objects.create_user(username=cd.get('username'), password=cd.get('password'))
+        User.objects.create_user(
+            username=cd.get('username'), password=cd.get('password'), hash_password=get_password_service().make_password
+        )
         messages.success(request, _('You have successfully registered with your username and password.'))
         return redirect('core:home')
 
 
-class UserLoginPhoneNumberView(BaseView):
+class UserLoginPhoneNumberView(BaseOtpView):
     template_name = 'accounts/login_phone_number.html'
     class_form = UserLoginPhoneNumberForm
+    form_need_request = True
 
     def is_valid(self, request, form):
-        code = str(random.randint(1000, 9999))
-        phone = form.cleaned_data.get('phone_number')
-        OtpCode.objects.create(phone_number=phone, code=code, expire_time=datetime.now() + timedelta(minutes=2))
-        send_sms_code_task.delay(phone, code)
+        send_otp_code(request, phone_number=form.cleaned_data.get('phone_number'))
         messages.success(request, _('We have sent a code to your phone number.'))
         return redirect('accounts:verify_otp')
 
 
-class UserRegisterPhoneNumberView(BaseView):
+class UserRegisterPhoneNumberView(BaseOtpView):
     template_name = 'accounts/register_phone_number.html'
     class_form = UserRegisterPhoneNumberForm
+    form_need_request = True
 
     def is_valid(self, request, form):
-        code = str(random.randint(1000, 9999))
-        phone = form.cleaned_data.get('phone_number')
-        OtpCode.objects.create(phone_number=phone, code=code, expire_time=datetime.now() + timedelta(minutes=2))
-        send_sms_code_task.delay(phone, code)
+        send_otp_code(request, phone_number=form.cleaned_data.get('phone_number'))
         messages.success(request, _('We have sent a code to your phone number.'))
         return redirect('accounts:verify_otp')
 
@@ -94,66 +119,188 @@ class VerifyOtpCodeView(BaseView):
         return redirect('core:home')
 
 
-class UserLoginEmailView(BaseView):
+class UserLoginEmailView(BaseOtpView):
     template_name = 'accounts/login_email.html'
     class_form = UserLoginEmailForm
+    form_need_request = True
 
     def is_valid(self, request, form):
-        code = str(random.randint(1000, 9999))
-        email = form.cleaned_data.get('email')
-        OtpCode.objects.create(email=email, code=code, expire_time=datetime.now() + timedelta(minutes=2))
-        send_mail_code_task.delay(email, code)
+        send_otp_code(request, email=form.cleaned_data.get('email'))
         messages.success(request, _('We have sent a code to your email.'))
         return redirect('accounts:verify_otp')
 
 
-class UserRegisterEmailView(BaseView):
+class UserRegisterEmailView(BaseOtpView):
     template_name = 'accounts/register_email.html'
     class_form = UserRegisterEmailForm
+    form_need_request = True
 
     def is_valid(self, request, form):
-        code = str(random.randint(1000, 9999))
-        email = form.cleaned_data.get('email')
-        OtpCode.objects.create(email=email, code=code, expire_time=datetime.now() + timedelta(minutes=2))
-        send_mail_code_task.delay(email, code)
+        send_otp_code(request, email=form.cleaned_data.get('email'))
         messages.success(request, _('We have sent a code to your email.'))
         return redirect('accounts:verify_otp')
 
 
-class UserLoginCombineView(BaseView):
+class UserLoginCombineView(BaseOtpView):
     template_name = 'accounts/login_combine.html'
     class_form = UserLoginCombineForm
+    form_need_request = True
 
     def is_valid(self, request, form):
-        code = str(random.randint(1000, 9999))
         info = form.cleaned_data.get('info')
-        expire_time = datetime.now() + timedelta(minutes=2)
         if '@' in info:
-            OtpCode.objects.create(email=info, code=code, expire_time=expire_time)
-            send_mail_code_task.delay(info, code)
+            send_otp_code(request, email=info)
             messages.success(request, _('We have sent a code to your email.'))
         else:
-            OtpCode.objects.create(phone_number=info, code=code, expire_time=expire_time)
-            send_sms_code_task.delay(info, code)
+            send_otp_code(request, phone_number=info)
             messages.success(request, _('We have sent a code to your phone number.'))
         return redirect('accounts:verify_otp')
 
 
-class UserRegisterCombineView(BaseView):
+class UserRegisterCombineView(BaseOtpView):
     template_name = 'accounts/register_combine.html'
     class_form = UserRegisterCombineForm
+    form_need_request = True
 
     def is_valid(self, request, form):
-        code = str(random.randint(1000, 9999))
         info = form.cleaned_data.get('info')
-        expire_time = datetime.now() + timedelta(minutes=2)
         if '@' in info:
-            OtpCode.objects.create(email=info, code=code, expire_time=expire_time)
-            send_mail_code_task.delay(info, code)
+            send_otp_code(request, email=info)
             messages.success(request, _('We have sent a code to your email.'))
         else:
-            OtpCode.objects.create(phone_number=info, code=code, expire_time=expire_time)
-            send_sms_code_task.delay(info, code)
+            send_otp_code(request, phone_number=info)
             messages.success(request, _('We have sent a code to your phone number.'))
         return redirect('accounts:verify_otp')
 
+
+class AsyncBaseView(View):
+    template_name = None
+    class_form = None
+    form_need_request = False
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        # django 3.2 only serves a view natively under asgi when it is a coroutine function
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        update_wrapper(async_view, view)
+        return async_view
+
+    async def http_method_not_allowed(self, request, *args, **kwargs):
+        return super().http_method_not_allowed(request, *args, **kwargs)
+
+    async def options(self, request, *args, **kwargs):
+        return super().options(request, *args, **kwargs)
+
+    async def get(self, request):
+        return await sync_to_async(render)(request, self.template_name, {"form": self.class_form()})
+
+    async def post(self, request):
+        if self.form_need_request:
+            form = self.class_form(request=request, data=request.POST)
+        else:
+            form = self.class_form(data=request.POST)
+        if await sync_to_async(form.is_valid)():
+            return await self.is_valid(request, form)
+        return await sync_to_async(render)(request, self.template_name, {"form": form})
+
+    async def is_valid(self, request, form):
+        pass
+
+
+class AsyncBaseOtpView(AsyncBaseView):
+    async def post(self, request):
+        try:
+            await sync_to_async(get_otp_rate_limiter().check_ip)(get_client_ip(request))
+            return await super().post(request)
+        except OtpRateLimited:
+            messages.warning(request, _('Too many code requests, please try again later.'))
+            return await sync_to_async(render)(request, self.template_name, {"form": self.class_form()}, status=429)
+
+
+class AsyncUserLoginPhoneNumberView(AsyncBaseOtpView):
+    template_name = 'accounts/login_phone_number.html'
+    class_form = UserLoginPhoneNumberForm
+    form_need_request = True
+
+    async def is_valid(self, request, form):
+        await asend_otp_code(request, phone_number=form.cleaned_data.get('phone_number'))
+        messages.success(request, _('We have sent a code to your phone number.'))
+        return redirect('accounts:async_verify_otp')
+
+
+class AsyncUserRegisterPhoneNumberView(AsyncBaseOtpView):
+    template_name = 'accounts/register_phone_number.html'
+    class_form = UserRegisterPhoneNumberForm
+    form_need_request = True
+
+    async def is_valid(self, request, form):
+        await asend_otp_code(request, phone_number=form.cleaned_data.get('phone_number'))
+        messages.success(request, _('We have sent a code to your phone number.'))
+        return redirect('accounts:async_verify_otp')
+
+
+class AsyncVerifyOtpCodeView(AsyncBaseView):
+    template_name = 'accounts/verify_otp_code.html'
+    class_form = VerifyOtpCodeForm
+    form_need_request = True
+
+    async def is_valid(self, request, form):
+        return redirect('core:home')
+
+
+class AsyncUserLoginEmailView(AsyncBaseOtpView):
+    template_name = 'accounts/login_email.html'
+    class_form = UserLoginEmailForm
+    form_need_request = True
+
+    async def is_valid(self, request, form):
+        await asend_otp_code(request, email=form.cleaned_data.get('email'))
+        messages.success(request, _('We have sent a code to your email.'))
+        return redirect('accounts:async_verify_otp')
+
+
+class AsyncUserRegisterEmailView(AsyncBaseOtpView):
+    template_name = 'accounts/register_email.html'
+    class_form = UserRegisterEmailForm
+    form_need_request = True
+
+    async def is_valid(self, request, form):
+        await asend_otp_code(request, email=form.cleaned_data.get('email'))
+        messages.success(request, _('We have sent a code to your email.'))
+        return redirect('accounts:async_verify_otp')
+
+
+class AsyncUserLoginCombineView(AsyncBaseOtpView):
+    template_name = 'accounts/login_combine.html'
+    class_form = UserLoginCombineForm
+    form_need_request = True
+
+    async def is_valid(self, request, form):
+        info = form.cleaned_data.get('info')
+        if '@' in info:
+            await asend_otp_code(request, email=info)
+            messages.success(request, _('We have sent a code to your email.'))
+        else:
+            await asend_otp_code(request, phone_number=info)
+            messages.success(request, _('We have sent a code to your phone number.'))
+        return redirect('accounts:async_verify_otp')
+
+
+class AsyncUserRegisterCombineView(AsyncBaseOtpView):
+    template_name = 'accounts/register_combine.html'
+    class_form = UserRegisterCombineForm
+    form_need_request = True
+
+    async def is_valid(self, request, form):
+        info = form.cleaned_data.get('info')
+        if '@' in info:
+            await asend_otp_code(request, email=info)
+            messages.success(request, _('We have sent a code to your email.'))
+        else:
+            await asend_otp_code(request, phone_number=info)
+            messages.success(request, _('We have sent a code to your phone number.'))
+        return redirect('accounts:async_verify_otp')
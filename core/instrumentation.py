@@ -0,0 +1,128 @@
+import threading
+import time
+from contextvars import ContextVar
+from celery.signals import before_task_publish, after_task_publish
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+from .metrics import registry, COUNT_BUCKETS
+
+
+# the stats of the request being served; asgiref copies the context into sync_to_async threads,
+# so queries run by async views are counted too
+current_request = ContextVar('current_request_metrics', default=None)
+
+request_seconds = registry.histogram(
+    'http_request_duration_seconds', 'Time spent serving a request.', ('view', 'method', 'status')
+)
+request_queries = registry.histogram(
+    'http_request_db_queries', 'Database queries per request.', ('view', ), buckets=COUNT_BUCKETS
+)
+request_db_seconds = registry.histogram('http_request_db_seconds', 'Database time per request.', ('view', ))
+request_template_seconds = registry.histogram(
+    'http_request_template_seconds', 'Template render time per request.', ('view', )
+)
+request_publish_seconds = registry.histogram(
+    'http_request_publish_seconds', 'Celery broker publish time per request.', ('view', )
+)
+request_cache = registry.counter(
+    'http_request_cache', 'Cache lookups made while serving requests.', ('view', 'cache', 'result')
+)
+cache_lookups = registry.counter('cache_lookups', 'Cache lookups by cache and result.', ('cache', 'result'))
+template_seconds = registry.histogram('template_render_seconds', 'Time spent rendering a template.', ('template', ))
+publish_seconds = registry.histogram('celery_publish_seconds', 'Time spent publishing a task to the broker.', ('task', ))
+
+
+class RequestMetrics:
+    __slots__ = ('view', 'queries', 'db_seconds', 'template_seconds', 'publish_seconds', 'cache')
+
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.publish_seconds = 0.0
+        self.cache = {}
+
+    def record(self, method, status, elapsed):
+        view = self.view or 'unresolved'
+        request_seconds.observe(elapsed, view=view, method=method, status=status)
+        request_queries.observe(self.queries, view=view)
+        request_db_seconds.observe(self.db_seconds, view=view)
+        request_template_seconds.observe(self.template_seconds, view=view)
+        if self.publish_seconds:
+            request_publish_seconds.observe(self.publish_seconds, view=view)
+        for (cache, result), count in self.cache.items():
+            request_cache.inc(count, view=view, cache=cache, result=result)
+
+
+def record_cache(cache, result):
+    # result is 'hit' or 'miss'; tiered caches may report where they hit, e.g. 'local_hit'
+    cache_lookups.inc(cache=cache, result=result)
+    metrics = current_request.get()
+    if metrics is not None:
+        metrics.cache[(cache, result)] = metrics.cache.get((cache, result), 0) + 1
+
+
+def count_query(execute, sql, params, many, context):
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_seconds += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    # the wrapper list outlives reconnects, so install it once per connection object
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+# celery hands the same headers dict to both signals and publishes from one thread; the start time is
+# kept per thread under the dict's id instead of in the headers, which go out to the broker. a publish
+# that fails leaves one entry per thread that the next publish overwrites
+_publishing = threading.local()
+
+
+@before_task_publish.connect
+def start_publish_timer(sender=None, headers=None, **kwargs):
+    _publishing.started = (id(headers), time.perf_counter())
+
+
+@after_task_publish.connect
+def stop_publish_timer(sender=None, headers=None, **kwargs):
+    started, _publishing.started = getattr(_publishing, 'started', None), None
+    if started is None or started[0] != id(headers):
+        return
+    elapsed = time.perf_counter() - started[1]
+    publish_seconds.observe(elapsed, task=sender)
+    metrics = current_request.get()
+    if metrics is not None:
+        metrics.publish_seconds += elapsed
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            elapsed = time.perf_counter() - start
+            template_seconds.observe(elapsed, template=self.origin.template_name or 'string')
+            metrics = current_request.get()
+            if metrics is not None:
+                metrics.template_seconds += elapsed
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
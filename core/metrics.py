@@ -0,0 +1,244 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from django.core.cache import caches
+
+
+logger = logging.getLogger(__name__)
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            values = {key: self.snapshot(value) for key, value in self._values.items()}
+        for key, value in sorted(values.items()):
+            lines.extend(self.render_value(key, value))
+        return lines
+
+    def snapshot(self, value):
+        return value
+
+    def render_value(self, key, value):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render_value(self, key, value):
+        yield f'{self.name}_total{format_labels(list(zip(self.labelnames, key)))} {value}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        # one counter per bucket, made cumulative only when rendered
+        key, index = self.key(labels), bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def snapshot(self, value):
+        return list(value[0]), value[1]
+
+    def render_value(self, key, value):
+        counts, total = value
+        pairs = list(zip(self.labelnames, key))
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf', ), counts):
+            cumulative += count
+            yield f'{self.name}_bucket{format_labels(pairs + [("le", bound)])} {cumulative}'
+        labels = format_labels(pairs)
+        yield f'{self.name}_sum{labels} {total}'
+        yield f'{self.name}_count{labels} {cumulative}'
+
+    def quantile(self, q, counts):
+        # linear interpolation inside the bucket, like prometheus' histogram_quantile()
+        total = sum(counts)
+        if not total:
+            return None
+        rank, cumulative, lower = q * total, 0, 0
+        for index, count in enumerate(counts):
+            if index == len(self.buckets):
+                return self.buckets[-1]
+            if count and cumulative + count >= rank:
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative, lower = cumulative + count, self.buckets[index]
+        return self.buckets[-1]
+
+
+class SharedMetric:
+    # values live in a django cache so every process (web and celery workers) adds to one set of series;
+    # a process sums its increments and writes them with one incr() per changed key at most every
+    # flush_interval seconds. label values are fixed up front so they can be read back
+    suffixes = ()
+
+    def setup_shared(self, label_values, alias, flush_interval):
+        self.label_values = [tuple(values) for values in label_values]
+        self.alias = alias
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._flushed_at = time.monotonic()
+        atexit.register(self.flush)
+
+    def cache_key(self, key, suffix):
+        return ':'.join(('metrics', self.name) + key + (str(suffix), ))
+
+    def incr(self, key, suffix, amount):
+        cache_key = self.cache_key(key, suffix)
+        with self._pending_lock:
+            if self._pid != os.getpid():
+                # a forked child starts empty, its parent still owns what was pending
+                self._pending, self._pid = {}, os.getpid()
+            self._pending[cache_key] = self._pending.get(cache_key, 0) + amount
+            due = time.monotonic() - self._flushed_at >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        cache = caches[self.alias]
+        for cache_key, amount in pending.items():
+            try:
+                try:
+                    cache.incr(cache_key, amount)
+                except ValueError:
+                    # first write of the key, or it was evicted
+                    if not cache.add(cache_key, amount, None):
+                        cache.incr(cache_key, amount)
+            except Exception:
+                # losing a sample is better than failing the work being measured
+                logger.warning('could not record metric %s', self.name, exc_info=True)
+
+    def read(self):
+        self.flush()
+        keys = {(key, suffix): self.cache_key(key, suffix) for key in self.label_values for suffix in self.suffixes}
+        stored = caches[self.alias].get_many(list(keys.values()))
+        return {key: self.load({suffix: stored.get(keys[key, suffix], 0) for suffix in self.suffixes})
+                for key in self.label_values}
+
+    def reset(self):
+        with self._pending_lock:
+            self._pending = {}
+        caches[self.alias].delete_many([
+            self.cache_key(key, suffix) for key in self.label_values for suffix in self.suffixes
+        ])
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, value in self.read().items():
+            lines.extend(self.render_value(key, value))
+        return lines
+
+
+class SharedCounter(SharedMetric, Counter):
+    suffixes = ('total', )
+
+    def __init__(self, name, documentation, labelnames=(), label_values=((), ), alias='default', flush_interval=1):
+        super().__init__(name, documentation, labelnames)
+        self.setup_shared(label_values, alias, flush_interval)
+
+    def inc(self, amount=1, **labels):
+        self.incr(self.key(labels), 'total', amount)
+
+    def load(self, stored):
+        return stored['total']
+
+
+class SharedHistogram(SharedMetric, Histogram):
+    def __init__(self, name, documentation, labelnames=(), label_values=((), ), buckets=LATENCY_BUCKETS,
+                 alias='default', flush_interval=1):
+        super().__init__(name, documentation, labelnames, buckets)
+        self.setup_shared(label_values, alias, flush_interval)
+        self.suffixes = tuple(range(len(self.buckets) + 1)) + ('sum', )
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        self.incr(key, bisect_left(self.buckets, value), 1)
+        # cache counters are integers, so the sum is kept in microseconds
+        self.incr(key, 'sum', int(value * 1000000))
+
+    def load(self, stored):
+        return [stored[index] for index in range(len(self.buckets) + 1)], stored['sum'] / 1000000
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def shared_metrics(self):
+        with self._lock:
+            return [metric for metric in self._metrics.values() if isinstance(metric, SharedMetric)]
+
+    def flush(self):
+        for metric in self.shared_metrics():
+            metric.flush()
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
@@ -0,0 +1,47 @@
+import asyncio
+import time
+from django.utils.decorators import sync_and_async_middleware
+from .instrumentation import RequestMetrics, current_request
+
+
+def view_label(view_func):
+    view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+    if view_class is not None:
+        return view_class.__name__
+    return getattr(view_func, '__name__', view_func.__class__.__name__)
+
+
+def record(request, response, metrics, start):
+    # the resolver match is set once the url resolved, so a 404 stays unresolved
+    match = getattr(request, 'resolver_match', None)
+    if match is not None:
+        metrics.view = view_label(match.func)
+    metrics.record(request.method, response.status_code, time.perf_counter() - start)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    # a coroutine function under asgi, so async views aren't pushed through a thread
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            metrics = RequestMetrics()
+            token = current_request.set(metrics)
+            start = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                current_request.reset(token)
+            record(request, response, metrics, start)
+            return response
+    else:
+        def middleware(request):
+            metrics = RequestMetrics()
+            token = current_request.set(metrics)
+            start = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                current_request.reset(token)
+            record(request, response, metrics, start)
+            return response
+    return middleware
@@ -1,3 +1,116 @@
-from django.test import TestCase
+import uuid
+from unittest import mock
+from celery.signals import after_task_publish, before_task_publish
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from accounts.models import User
+from accounts.throttling import get_trusted_proxies
+from .instrumentation import RequestMetrics, current_request, publish_seconds
+from .metrics import SharedCounter, SharedHistogram
 
-# Create your tests here.
+
+class MetricsMiddlewareTests(TestCase):
+    def recorded(self, path):
+        with mock.patch.object(RequestMetrics, 'record', autospec=True) as record:
+            self.client.get(path)
+        metrics, method, status, elapsed = record.call_args.args
+        return metrics, method, status
+
+    def test_view_is_labelled_from_the_resolver_match(self):
+        metrics, method, status = self.recorded(reverse('core:home'))
+        self.assertEqual((metrics.view, method, status), ('HomeView', 'GET', 200))
+
+    def test_unresolved_url_has_no_view(self):
+        metrics, method, status = self.recorded('/no-such-page/')
+        self.assertEqual((metrics.view, status), (None, 404))
+
+    def test_queries_are_counted_for_the_request(self):
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            User.objects.count()
+            User.objects.exists()
+        finally:
+            current_request.reset(token)
+        self.assertEqual(metrics.queries, 2)
+        self.assertGreater(metrics.db_seconds, 0)
+
+
+class PublishTimerTests(TestCase):
+    def test_publish_is_timed_without_touching_the_headers(self):
+        headers = {'id': 'task-id'}
+        with mock.patch.object(publish_seconds, 'observe') as observe:
+            before_task_publish.send(sender='task', headers=headers)
+            self.assertEqual(headers, {'id': 'task-id'})
+            after_task_publish.send(sender='task', headers=headers)
+        observe.assert_called_once_with(mock.ANY, task='task')
+
+    def test_failed_publish_is_not_timed_by_the_next_one(self):
+        with mock.patch.object(publish_seconds, 'observe') as observe:
+            before_task_publish.send(sender='task', headers={'id': 'failed'})
+            after_task_publish.send(sender='task', headers={'id': 'other'})
+        observe.assert_not_called()
+
+
+@override_settings(METRICS_ALLOWED_IPS=('127.0.0.1', ))
+class MetricsViewTests(TestCase):
+    def setUp(self):
+        get_trusted_proxies.cache_clear()
+        self.addCleanup(get_trusted_proxies.cache_clear)
+
+    def get(self, remote_addr, forwarded=None):
+        extra = {'REMOTE_ADDR': remote_addr}
+        if forwarded is not None:
+            extra['HTTP_X_FORWARDED_FOR'] = forwarded
+        return self.client.get(reverse('core:metrics'), **extra).status_code
+
+    def test_local_scrape_is_allowed(self):
+        self.assertEqual(self.get('127.0.0.1'), 200)
+
+    def test_remote_client_is_refused(self):
+        self.assertEqual(self.get('10.0.0.1'), 404)
+
+    def test_request_forwarded_by_an_untrusted_proxy_is_refused(self):
+        self.assertEqual(self.get('127.0.0.1', '203.0.113.7'), 404)
+
+    @override_settings(TRUSTED_PROXIES=['127.0.0.1'])
+    def test_client_behind_a_trusted_proxy_is_checked(self):
+        self.assertEqual(self.get('127.0.0.1', '203.0.113.7'), 404)
+        self.assertEqual(self.get('127.0.0.1', '203.0.113.7, 127.0.0.1'), 404)
+        self.assertEqual(self.get('127.0.0.1'), 200)
+
+
+class SharedMetricTests(TestCase):
+    def setUp(self):
+        self.name = f'test_{uuid.uuid4().hex}'
+        self.cache = caches['default']
+
+    def test_samples_are_written_in_batches(self):
+        histogram = SharedHistogram(self.name, 'Test.', buckets=(1, 10), flush_interval=60)
+        with mock.patch.object(self.cache, 'incr', wraps=self.cache.incr) as incr:
+            for value in (0.5, 0.5, 5):
+                histogram.observe(value)
+            incr.assert_not_called()
+            histogram.flush()
+        self.assertEqual(incr.call_count, 3)
+        self.assertEqual(histogram.read()[()], ([2, 1, 0], 6.0))
+
+    def test_due_flush_happens_on_observe(self):
+        counter = SharedCounter(self.name, 'Test.', flush_interval=0)
+        counter.inc()
+        counter.inc(2)
+        self.assertEqual(self.cache.get(f'metrics:{self.name}:total'), 3)
+
+    def test_evicted_key_is_created_again(self):
+        counter = SharedCounter(self.name, 'Test.', flush_interval=0)
+        counter.inc()
+        self.cache.delete(f'metrics:{self.name}:total')
+        counter.inc()
+        self.assertEqual(counter.read()[()], 1)
+
+    def test_reset_drops_pending_samples(self):
+        counter = SharedCounter(self.name, 'Test.', flush_interval=60)
+        counter.inc()
+        counter.reset()
+        self.assertEqual(counter.read()[()], 0)
@@ -5,4 +5,5 @@ from . import views
 app_name = 'core'
 urlpatterns = [
     path('', views.HomeView.as_view(), name='home'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
 ]
@@ -1,5 +1,9 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
 from django.views.generic.base import View
+from accounts.throttling import get_client_ip, is_trusted_proxy
+from .metrics import registry
 
 
 class HomeView(View):
@@ -7,3 +11,15 @@ class HomeView(View):
 
     def get(self, request):
         return render(request, self.template_name)
+
+
+class MetricsView(View):
+    def get(self, request):
+        # behind a local reverse proxy every request comes from 127.0.0.1, so the client is resolved through
+        # TRUSTED_PROXIES and a forwarded request from a proxy that isn't trusted is refused
+        forwarded = 'HTTP_X_FORWARDED_FOR' in request.META
+        if forwarded and not is_trusted_proxy(request.META.get('REMOTE_ADDR')):
+            raise Http404
+        if get_client_ip(request) not in settings.METRICS_ALLOWED_IPS:
+            raise Http404
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')